@@ -1,9 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 import jwt
-from generate import generate_song
+from fastapi.responses import StreamingResponse
+from jobs import JobQueue, QueueFull
+from result_cache import ResultCache, model_version
 from loguru import logger
 import os
+import re
+import time
+import queue
+import struct
+import asyncio
+import threading
 from dotenv import load_dotenv
 import uvicorn
 
@@ -17,6 +25,41 @@ SECRET_KEY = os.getenv("SECRET_KEY", "wXr7862875dxFIi3iTgXCxejaHv5B9UVGHZYNBRFVS
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+RESULT_CACHE = ResultCache(os.getenv("RESULT_CACHE_DIR") or os.path.join(os.getenv('OUTPUT_DIR'), "cache"),
+                           max_bytes=int(float(os.getenv("RESULT_CACHE_GB", "2")) * 1024 ** 3))
+CHECKPOINT = os.path.join(os.getenv('MODEL_DIR'), "music_generator.pt")
+JOB_QUEUE = JobQueue(workers=int(os.getenv("GENERATION_WORKERS", "1")),
+                     max_pending=int(os.getenv("MAX_PENDING_JOBS", "8")), cache=RESULT_CACHE,
+                     batch_window=float(os.getenv("BATCH_WINDOW_MS", "50")) / 1000,
+                     max_batch=int(os.getenv("MAX_BATCH_SIZE", "4")))
+STARTED = {"at": None, "warmup_seconds": None, "error": None}
+
+def record_warm_up(futures):
+    try:
+        for future in futures:
+            future.result()
+        STARTED["warmup_seconds"] = time.perf_counter() - STARTED["at"]
+        logger.info(f"Generation workers ready in {STARTED['warmup_seconds']:.2f}s")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        STARTED["error"] = str(e)
+
+@app.on_event("startup")
+def start_workers():
+    # Worker processes load the models in the background; the server answers right away
+    STARTED["at"] = time.perf_counter()
+    JOB_QUEUE.start()
+    threading.Thread(target=record_warm_up, args=(JOB_QUEUE.warm_futures,), name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_workers():
+    JOB_QUEUE.shutdown()
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "ready": STARTED["warmup_seconds"] is not None, "warmup_seconds": STARTED["warmup_seconds"],
+            "pending_jobs": JOB_QUEUE.pending(), "max_pending_jobs": JOB_QUEUE.max_pending, "error": STARTED["error"]}
+
 def verify_token(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -26,15 +69,133 @@ def verify_token(token: str = Depends(oauth2_scheme)):
         logger.error(f"Invalid token: {e}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
-@app.get("/generate_song")
-async def api_generate_song(prompt: str = "happy pop song in C major", tempo: int = 120, key: str = "C", mode: str = "major", style: str = "pop", token: dict = Depends(verify_token)):
+def wav_header(sample_rate=16000, channels=1, bits=16):
+    # Sizes are unknown while streaming; 0xFFFFFFFF is the usual "until EOF" marker
+    block_align = channels * bits // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVEfmt " +
+            struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits) +
+            b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+async def relay_chunks(job, chunks):
+    """
+    WAV header, then PCM chunks from the job's worker as they arrive.
+    """
+    yield wav_header()
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            chunk = await loop.run_in_executor(None, lambda: chunks.get(timeout=1.0))
+        except queue.Empty:
+            if job["done"].done():
+                return  # Worker died without reaching the end-of-stream marker
+            continue
+        if chunk is None:
+            return
+        yield chunk
+
+def file_response(path, request, chunk_size=1 << 16):
+    """
+    Serves a finished WAV, honouring a single "bytes=start-end" Range header.
+    The file is opened up front, so a cache eviction after this point can't
+    cut the response short; one before it is a 410.
+    """
     try:
-        output_file = os.path.join(os.getenv('OUTPUT_DIR'), f"generated_song_{token.get('user')}.wav")
-        generate_song(prompt=prompt, output_file=output_file, tempo=tempo, key=key, mode=mode, style=style)
-        return {"message": f"Song generated successfully at {output_file}"}
-    except Exception as e:
-        logger.error(f"Error generating song: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate song")
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Song is no longer cached, request it again")
+    size = os.fstat(f.fileno()).st_size
+    start, end, status = 0, size - 1, 200
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("range", "").strip())
+    if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(size - int(match.group(2)), 0)
+        if start > end:
+            f.close()
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        status = 206
+
+    def body():
+        with f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(body(), status_code=status, media_type="audio/wav", headers=headers)
+
+def job_view(job):
+    return {"job_id": job["id"], "status": job["status"], "error": job["error"], "created": job["created"],
+            "started": job["started"], "finished": job["finished"],
+            "status_url": f"/jobs/{job['id']}", "result_url": f"/jobs/{job['id']}/result"}
+
+def get_own_job(job_id, token):
+    job = JOB_QUEUE.get(job_id)
+    if job is None or token.get('user') not in job["owners"]:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/generate_song", status_code=202)
+async def api_generate_song(prompt: str = "happy pop song in C major", tempo: int = 120, key: str = "C", mode: str = "major", style: str = "pop", seed: int = 0, duration: float = None, token: dict = Depends(verify_token)):
+    params = {"prompt": prompt, "tempo": tempo, "key": key, "mode": mode, "style": style, "seed": seed, "duration": duration}
+    # Identical requests share one file and one generation; the file is named by the cache key
+    cache_key = RESULT_CACHE.key(params, seed, model_version(CHECKPOINT))
+    try:
+        job_id = JOB_QUEUE.submit(token.get('user'), params, key=cache_key)
+    except QueueFull as e:
+        logger.warning(f"Rejecting generation request: {e}")
+        raise HTTPException(status_code=503, detail="Generation queue is full, retry later", headers={"Retry-After": "30"})
+    return job_view(JOB_QUEUE.get(job_id))
+
+@app.get("/jobs/{job_id}")
+async def api_job_status(job_id: str, token: dict = Depends(verify_token)):
+    return job_view(get_own_job(job_id, token))
+
+@app.get("/jobs/{job_id}/result")
+async def api_job_result(job_id: str, request: Request, token: dict = Depends(verify_token)):
+    job = get_own_job(job_id, token)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Song generation failed: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return file_response(job["result"], request)
+
+@app.get("/stream_song")
+async def api_stream_song(request: Request, prompt: str = "happy pop song in C major", tempo: int = 120, key: str = "C", mode: str = "major", style: str = "pop", seed: int = 0, duration: float = None, token: dict = Depends(verify_token)):
+    """
+    Streams the song as a WAV over chunked transfer while it is generated,
+    so playback can start before generation finishes. Songs already cached
+    are served from disk, with Range support.
+    """
+    params = {"prompt": prompt, "tempo": tempo, "key": key, "mode": mode, "style": style, "seed": seed, "duration": duration}
+    cache_key = RESULT_CACHE.key(params, seed, model_version(CHECKPOINT))
+    try:
+        job_id = JOB_QUEUE.submit(token.get('user'), params, key=cache_key, stream=True)
+    except QueueFull as e:
+        logger.warning(f"Rejecting streaming request: {e}")
+        raise HTTPException(status_code=503, detail="Generation queue is full, retry later", headers={"Retry-After": "30"})
+    job = JOB_QUEUE.get(job_id)
+    if job["status"] == "done":
+        return file_response(job["result"], request)
+    # Only the request that started the generation relays its stream
+    chunks = job.pop("chunks", None)
+    if chunks is None:
+        # Joined an identical generation that is already running: wait for its file
+        await asyncio.wrap_future(job["done"])
+        job = JOB_QUEUE.get(job_id)
+        if job["status"] != "done":
+            raise HTTPException(status_code=500, detail=f"Song generation failed: {job['error']}")
+        return file_response(job["result"], request)
+    return StreamingResponse(relay_chunks(job, chunks), media_type="audio/wav", headers={"X-Job-Id": job_id})
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,90 @@
+import os
+import time
+import argparse
+import itertools
+import numpy as np
+from benchmarking import peak_rss_mb, run_cases, summarize
+
+def time_calls(fn, warmup, repeats):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def run_case(case):
+    """
+    Builds one layer group with random weights and times it. Runs in a fresh
+    process so peak RSS belongs to this case alone.
+    """
+    import tensorflow as tf
+    from tensorflow.keras import layers, models
+    from model import build_hybrid_music_generator, midi_track_block, spec_track_block
+
+    group, seq_length, batch_size = case["group"], case["seq_length"], case["batch_size"]
+    n_mels, feature_dim, num_tracks = 128, 3, 4
+    rng = np.random.default_rng(0)
+    if case["bfloat16"]:
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    baseline = peak_rss_mb()
+
+    def midi_batch(width):
+        notes = rng.integers(0, 128, size=(batch_size, seq_length, 1))
+        return np.concatenate([notes, rng.random((batch_size, seq_length, width - 1))], axis=-1).astype(np.float32)
+
+    if group == "midi_track":
+        inp = layers.Input(shape=(seq_length, feature_dim))
+        model = models.Model(inp, midi_track_block(inp, feature_dim=feature_dim, long_conv=case["long_conv"]))
+        x = [midi_batch(feature_dim)]
+    elif group == "spec_track":
+        inp = layers.Input(shape=(seq_length, n_mels))
+        model = models.Model(inp, spec_track_block(inp, n_mels=n_mels))
+        x = [rng.random((batch_size, seq_length, n_mels), dtype=np.float32)]
+    else:
+        model = build_hybrid_music_generator(seq_length=seq_length, n_mels=n_mels, feature_dim=feature_dim,
+                                             num_tracks=num_tracks, long_conv=case["long_conv"], remat=case["remat"])
+        x = [midi_batch(feature_dim * num_tracks),
+             rng.random((batch_size, seq_length, n_mels * num_tracks), dtype=np.float32),
+             rng.random((batch_size, 64), dtype=np.float32)]
+
+    forward = tf.function(lambda inputs: model(inputs, training=False))
+    inputs = [tf.constant(a) for a in x]
+    if case["mode"] == "forward":
+        latencies = time_calls(lambda: forward(inputs).numpy(), case["warmup"], case["repeats"])
+    else:
+        model.compile(optimizer="adam", loss="mse")
+        target = np.zeros(model.output_shape[1:], dtype=np.float32)[None].repeat(batch_size, axis=0)
+        latencies = time_calls(lambda: model.train_on_batch(x, target), case["warmup"], case["repeats"])
+
+    result = dict(case)
+    result.update(summarize(latencies, batch_size, seq_length))
+    result["params"] = int(model.count_params())
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["peak_rss_delta_mb"] = result["peak_rss_mb"] - baseline
+    return result
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark build_hybrid_music_generator forward and training steps")
+    parser.add_argument("--seq-lengths", type=int, nargs="+", default=[1024, 4096, 16384], help="Sequence lengths to sweep")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2], help="Batch sizes to sweep")
+    parser.add_argument("--groups", nargs="+", default=["midi_track", "spec_track", "full"], help="Layer groups to time")
+    parser.add_argument("--modes", nargs="+", default=["forward", "train_step"], help="forward and/or train_step")
+    parser.add_argument("--long-conv", action="store_true", help="Use the FFT Hyena operator in striped_hyena_layer")
+    parser.add_argument("--remat", action="store_true", help="Rematerialize per-track blocks (full model only)")
+    parser.add_argument("--bfloat16", action="store_true", help="Use the mixed_bfloat16 policy")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before measuring")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per case")
+    parser.add_argument("--output", type=str, default=None, help="Append JSON lines here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cases = ({"model": "hybrid_music_generator", "group": group, "mode": mode, "seq_length": seq_length,
+              "batch_size": batch_size, "long_conv": args.long_conv, "remat": args.remat, "bfloat16": args.bfloat16,
+              "warmup": args.warmup, "repeats": args.repeats, "cpu_count": os.cpu_count()}
+             for group, mode, seq_length, batch_size in itertools.product(args.groups, args.modes, args.seq_lengths,
+                                                                         args.batch_sizes))
+    run_cases(run_case, cases, args.output)
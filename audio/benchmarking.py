@@ -0,0 +1,43 @@
+import sys
+import json
+import resource
+import multiprocessing
+import numpy as np
+
+def peak_rss_mb():
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+def summarize(latencies, batch_size, seq_length):
+    median = float(np.median(latencies))
+    return {
+        "latency_ms_median": median,
+        "latency_ms_p90": float(np.percentile(latencies, 90)),
+        "latency_ms_min": float(np.min(latencies)),
+        "throughput_steps_per_s": batch_size * seq_length / (median / 1000),
+    }
+
+def run_isolated(run_case, case):
+    # A fresh spawned process per case, so peak RSS belongs to that case alone
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case,))
+
+def run_cases(run_case, cases, output=None):
+    """
+    Runs every case in isolation and writes one JSON line per case to output
+    (appended) or stdout. A failing case is recorded with its error.
+    """
+    out = open(output, "a") if output else sys.stdout
+    try:
+        for case in cases:
+            try:
+                result = run_isolated(run_case, case)
+            except Exception as e:
+                result = dict(case, error=str(e))
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
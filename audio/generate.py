@@ -1,142 +1,90 @@
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 import numpy as np
-import mido
 import os
+import argparse
 import subprocess
 import librosa
+import soundfile as sf
 from loguru import logger
-from music21 import chord, scale, key, stream
+from seed_corpus import get_seed_corpus
+from hyena import CUSTOM_OBJECTS as HYENA_OBJECTS
+from memory import CUSTOM_OBJECTS as MEMORY_OBJECTS
+from segments import CUSTOM_OBJECTS as SEGMENT_OBJECTS
+from model import build_streaming_generator, generator_inputs
+from streaming import generate_incremental
+from render import QUALITY_LEVELS, render_tracks
+from midi_writer import steps_to_track, write_midi
+from mixing import mix
 
 LOG_FILE = os.path.join("$LOG_DIR", "generate.log")
 SOUNDFONT_PATH = "$BASE_DIR/GeneralUser_GS_v1.471.sf2"
 logger.add(LOG_FILE, rotation="500 MB")
+WINDOW_FRAMES = 16384
+MIDI_DIM = 12  # 3 features * 4 tracks
 
-def load_midi_data(midi_dir, track_type):
-    midi_files = glob.glob(f"{midi_dir}/*_{track_type}.mid")
-    sequences = []
-    for midi_file in midi_files:
-        midi = mido.MidiFile(midi_file)
-        tracks = [t for t in midi.tracks if (track_type == "drums") == (mido.midifiles.MetaMessage('track_name', 'drums') in t)]
-        merged_track = mido.MidiTrack()
-        for track in tracks:
-            merged_track.extend(track)
-        notes, velocities, times = [], [], []
-        time = 0
-        for msg in merged_track:
-            time += msg.time
-            if msg.type == 'note_on':
-                notes.append(msg.note)
-                velocities.append(msg.velocity)
-                times.append(time)
-            elif msg.type == 'note_off':
-                notes.append(msg.note)
-                velocities.append(0)
-                times.append(time)
-        sequence_length = 16384
-        if len(notes) < sequence_length:
-            notes += [0] * (sequence_length - len(notes))
-            velocities += [0] * (sequence_length - len(velocities))
-            times += [0] * (sequence_length - len(times))
-        else:
-            notes = notes[:sequence_length]
-            velocities = velocities[:sequence_length]
-            times = times[:sequence_length]
-        sequences.append(np.array([notes, velocities, times]).T)
-    return np.array(sequences)
-
-def load_spectrogram_data(spec_dir, track_type):
-    spec_files = glob.glob(f"{spec_dir}/*_{track_type}.npy")
-    sequences = []
-    for spec_file in spec_files:
-        spec = np.load(spec_file)
-        sequence_length = 16384
-        if spec.shape[1] < sequence_length:
-            spec = np.pad(spec, ((0, 0), (0, sequence_length - spec.shape[1])), mode='constant')
-        else:
-            spec = spec[:, :sequence_length]
-        sequences.append(spec.T)
-    return np.array(sequences)
-
-def encode_music_theory(midi_data, track_type):
-    s = stream.Stream()
-    for note, vel, time in midi_data.T[:3]:
-        if vel > 0 and note > 0:
-            s.append(note.Note(note, quarterLength=time/480))
-    k = s.analyze('key')
-    scale_obj = scale.MajorScale(k.tonic)
-    chords = [c for c in s.chordify().getElementsByClass(chord.Chord)]
-    key_encoding = np.zeros(12)
-    key_encoding[k.tonic.pitchClass] = 1
-    scale_encoding = np.zeros(len(scale_obj.pitches))
-    for p in scale_obj.pitches:
-        scale_encoding[p.pitchClass] = 1
-    chord_encoding = np.zeros(48)
-    for c in chords[:16]:
-        if c.isMajorTriad():
-            chord_encoding[c.root().pitchClass * 4] = 1
-        elif c.isMinorTriad():
-            chord_encoding[c.root().pitchClass * 4 + 1] = 1
-    return np.concatenate([key_encoding, scale_encoding, chord_encoding])
+def render_midi(midi_file, output_file, sr=44100):
+    # For generators that predict MIDI only: synthesize with the General MIDI soundfont
+    subprocess.run(["fluidsynth", "-ni", "-F", output_file, "-r", str(sr), SOUNDFONT_PATH, midi_file],
+                   check=True, capture_output=True)
 
-def generate_song(output_file="$OUTPUT_DIR/generated_song.wav"):
+def generate_song(output_file="$OUTPUT_DIR/generated_song.wav", corpus=None, quality="standard"):
     try:
-        model = load_model("$MODEL_DIR/hybrid_music_generator.h5")
+        model = load_model("$MODEL_DIR/hybrid_music_generator.h5", custom_objects={**HYENA_OBJECTS, **MEMORY_OBJECTS, **SEGMENT_OBJECTS})
         track_types = ["vocals", "drums", "bass", "other"]
         
         # Seed with sample data
-        midi_data = np.concatenate([load_midi_data("$MIDI_DIR", t)[np.random.randint(len(load_midi_data("$MIDI_DIR", t)))] for t in track_types], axis=-1)
-        spec_data = np.concatenate([load_spectrogram_data("$SPEC_DIR", t)[np.random.randint(len(load_spectrogram_data("$SPEC_DIR", t)))] for t in track_types], axis=-1)
-        theory_data = np.concatenate([encode_music_theory(load_midi_data("$MIDI_DIR", t)[0], t) for t in track_types])
+        corpus = get_seed_corpus() if corpus is None else corpus
+        song_id, midi_data, spec_data, theory = corpus.sample()
+        theory_data = theory[None]
+        logger.info(f"Seeding generation with {song_id}")
         
         # Generate structured song (intro, verse, chorus, verse, outro)
         structure = [("intro", 1), ("verse", 2), ("chorus", 2), ("verse", 2), ("outro", 1)]
-        full_midi, full_spec = [], []
-        seed_midi, seed_spec = midi_data[None, :16384, :], spec_data[None, :16384, :]
-        for section, repeats in structure:
-            for _ in range(repeats):
-                generated = model.predict([seed_midi, seed_spec, theory_data])
-                full_midi.append(generated[0, :, :12])  # MIDI (3 features * 4 tracks)
-                full_spec.append(generated[0, :, 12:])  # Spectrograms (128 * 4 tracks)
-                seed_midi = generated[:, -16384:, :12]
-                seed_spec = generated[:, -16384:, 12:]
+        seed_midi, seed_spec = midi_data[None, :WINDOW_FRAMES, :], spec_data[None, :WINDOW_FRAMES, :]
+        num_frames = sum(repeats for _, repeats in structure) * WINDOW_FRAMES
+        # Stateful copy generates chunk by chunk, feeding each chunk's output back as the next input
+        streaming = build_streaming_generator(model)
+        if streaming is None:
+            logger.info("Model doesn't support stateful inference, generating full windows")
+            windows = []
+            for section, repeats in structure:
+                for _ in range(repeats):
+                    generated = model.predict(generator_inputs(model, seed_midi, seed_spec, theory_data))
+                    windows.append(generated[0])
+                    seed_midi = generated[:, -WINDOW_FRAMES:, :MIDI_DIM]
+                    # A generator that predicts only MIDI features keeps the seed spectrogram as input
+                    if generated.shape[-1] > MIDI_DIM:
+                        seed_spec = generated[:, -WINDOW_FRAMES:, MIDI_DIM:]
+            generated = np.concatenate(windows, axis=0)
+        else:
+            generated = generate_incremental(streaming, (seed_midi, seed_spec), tf.constant(theory_data, dtype=tf.float32),
+                                             num_frames, midi_dim=MIDI_DIM)[0]
+        full_midi = generated[:, :MIDI_DIM]
+        full_spec = generated[:, MIDI_DIM:] if generated.shape[-1] > MIDI_DIM else None
         
         # MIDI output for reference
-        midi = mido.MidiFile()
-        tempo = 120
-        ticks_per_beat = 480
-        for i, track_type in enumerate(track_types):
-            track = mido.MidiTrack()
-            midi.tracks.append(track)
-            track.append(mido.MetaMessage('track_name', name=track_type))
-            track.append(mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(tempo)))
-            time = 0
-            for step in np.concatenate(full_midi, axis=0)[:, i*3:(i+1)*3]:
-                note = int(step[0] * 127)
-                velocity = int(step[1] * 127)
-                delta = int(step[2] * ticks_per_beat / 4)
-                if note > 0 and velocity > 0:
-                    track.append(mido.Message('note_on', note=note, velocity=velocity, time=time))
-                    track.append(mido.Message('note_off', note=note, velocity=0, time=delta or (ticks_per_beat // 4)))
-                time = 0
-        midi.save(f"{output_file}.mid")
+        write_midi(f"{output_file}.mid", [steps_to_track(full_midi[:, i*3:(i+1)*3], name=track_type)
+                                          for i, track_type in enumerate(track_types)], tempo=120)
         
-        # Spectrogram to audio
         sr = 44100
-        audio_tracks = []
-        full_spec = np.concatenate(full_spec, axis=0)
-        for i in range(len(track_types)):
-            mel_spec = full_spec[:, i*128:(i+1)*128].T
-            mel_spec = np.exp(librosa.db_to_power(mel_spec))
-            audio = librosa.feature.inverse.mel_to_audio(mel_spec, sr=sr, hop_length=512)
-            audio_tracks.append(audio)
-        
-        # Mix tracks
-        mixed_audio = np.sum(audio_tracks, axis=0) / len(audio_tracks)
-        librosa.output.write_wav(output_file, mixed_audio, sr)
+        if full_spec is None:
+            logger.info(f"Generator predicts MIDI only ({generated.shape[-1]} features), rendering with {SOUNDFONT_PATH}")
+            render_midi(f"{output_file}.mid", output_file, sr)
+        else:
+            # Spectrogram to audio: all tracks, chunked and crossfaded, rendered in parallel with fast Griffin-Lim
+            mel_specs = [np.exp(librosa.db_to_power(full_spec[:, i*128:(i+1)*128].T)) for i in range(len(track_types))]
+            audio_tracks = render_tracks(mel_specs, sr=sr, hop_length=512, quality=quality)
+            # Mix tracks (equal gains, limited)
+            mixed_audio = mix(np.stack(audio_tracks), gains=[1 / len(audio_tracks)] * len(audio_tracks), orig_sr=sr)
+            sf.write(output_file, mixed_audio, sr)
         logger.info(f"Generated song saved to {output_file} and {output_file}.mid")
     except Exception as e:
         logger.error(f"Error during song generation: {e}")
 
 if __name__ == "__main__":
-    generate_song()
+    parser = argparse.ArgumentParser(description="Generate a song with the hybrid music generator")
+    parser.add_argument("--output", type=str, default="$OUTPUT_DIR/generated_song.wav", help="Output WAV file")
+    parser.add_argument("--quality", choices=list(QUALITY_LEVELS), default="standard", help="Griffin-Lim rendering quality")
+    args = parser.parse_args()
+    generate_song(args.output, quality=args.quality)
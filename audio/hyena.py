@@ -0,0 +1,97 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+def fft_causal_conv(x, h):
+    """
+    Causal convolution of x (batch, length, channels) with per-channel filters
+    h (length, channels) in O(L log L). Zero-padding to 2L makes the circular
+    FFT product a linear convolution, and keeping the first L outputs means
+    y[t] only depends on x[:t + 1].
+    """
+    length = tf.shape(x)[1]
+    n = 2 * length
+    x_f = tf.signal.rfft(tf.transpose(x, [0, 2, 1]), fft_length=[n])
+    h_f = tf.signal.rfft(tf.transpose(h, [1, 0]), fft_length=[n])
+    y = tf.signal.irfft(x_f * h_f[None], fft_length=[n])[..., :length]
+    return tf.transpose(y, [0, 2, 1])
+
+class HyenaFilter(layers.Layer):
+    """
+    Implicit long convolution filter: taps are produced by a small sine-activated
+    MLP over positional features and shaped by a per-channel exponential decay,
+    so the parameter count doesn't grow with sequence length.
+    """
+    def __init__(self, channels, hidden=64, num_bands=8, max_length=16384, min_decay=1.0, max_decay=300.0, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = channels
+        self.hidden = hidden
+        self.num_bands = num_bands
+        self.max_length = max_length
+        self.min_decay = min_decay
+        self.max_decay = max_decay
+
+    def build(self, input_shape):
+        # float32 taps whatever the policy: they meet the float32 decay and FFT
+        self.mlp = [layers.Dense(self.hidden, activation=tf.sin, dtype="float32"),
+                    layers.Dense(self.hidden, activation=tf.sin, dtype="float32"),
+                    layers.Dense(self.channels, dtype="float32")]
+        self.decay = tf.constant(np.linspace(self.min_decay, self.max_decay, self.channels), dtype=tf.float32)
+        self.skip = self.add_weight(name="skip", shape=(self.channels,), initializer="ones")
+        super().build(input_shape)
+
+    def filter(self, length):
+        # Positions are normalized by max_length, not the input length, so the
+        # same taps apply to every window size
+        t = tf.cast(tf.range(length), tf.float32)[:, None] / self.max_length
+        bands = 2 * np.pi * tf.range(1, self.num_bands + 1, dtype=tf.float32)[None]
+        h = tf.concat([t, tf.sin(bands * t), tf.cos(bands * t)], axis=-1)
+        for layer in self.mlp:
+            h = layer(h)
+        return h * tf.exp(-self.decay[None] * t)
+
+    def call(self, x):
+        x32 = tf.cast(x, tf.float32)
+        y = fft_causal_conv(x32, self.filter(tf.shape(x)[1])) + x32 * tf.cast(self.skip, tf.float32)
+        return tf.cast(y, x.dtype)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"channels": self.channels, "hidden": self.hidden, "num_bands": self.num_bands,
+                       "max_length": self.max_length, "min_decay": self.min_decay, "max_decay": self.max_decay})
+        return config
+
+class HyenaOperator(layers.Layer):
+    """
+    Order-2 Hyena operator: y = x2 * (h2 conv (x1 * (h1 conv v))), where v, x1,
+    x2 are projections of the input passed through a short causal depthwise
+    convolution. Drop-in replacement for the SimpleRNN in striped_hyena_layer:
+    causal, but computed in parallel over the whole sequence.
+    """
+    def __init__(self, filters, short_kernel=3, max_length=16384, **kwargs):
+        super().__init__(**kwargs)
+        self.filters = filters
+        self.short_kernel = short_kernel
+        self.max_length = max_length
+
+    def build(self, input_shape):
+        self.in_proj = layers.Dense(3 * self.filters)
+        self.short_conv = layers.DepthwiseConv1D(self.short_kernel, padding="valid")
+        self.long_convs = [HyenaFilter(self.filters, max_length=self.max_length) for _ in range(2)]
+        self.out_proj = layers.Dense(self.filters)
+        super().build(input_shape)
+
+    def call(self, x):
+        z = self.in_proj(x)
+        z = self.short_conv(tf.pad(z, [[0, 0], [self.short_kernel - 1, 0], [0, 0]]))
+        v, x1, x2 = tf.split(z, 3, axis=-1)
+        v = x1 * self.long_convs[0](v)
+        v = x2 * self.long_convs[1](v)
+        return self.out_proj(v)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"filters": self.filters, "short_kernel": self.short_kernel, "max_length": self.max_length})
+        return config
+
+CUSTOM_OBJECTS = {"HyenaFilter": HyenaFilter, "HyenaOperator": HyenaOperator}
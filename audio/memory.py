@@ -0,0 +1,106 @@
+import math
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+# Rough activation footprint of build_hybrid_music_generator, in values stored
+# per time step for the backward pass. Per-track figures are the sum of layer
+# output widths in one MIDI block (embedding, two striped Hyena layers, dense)
+# plus one spectrogram block (conv, LSTM gates/state, projection).
+TRACK_VALUES_PER_STEP = 3300
+# What a rematerialized track keeps: its block input and output
+REMAT_TRACK_VALUES_PER_STEP = 262
+FUSION_VALUES_PER_STEP = 800
+BACKWARD_FACTOR = 2  # gradients of the activations are about as large again
+
+class Remat(layers.Layer):
+    """
+    Runs a block (a Keras model) under tf.recompute_grad: its intermediate
+    activations are dropped after the forward pass and recomputed during
+    backprop, trading compute for activation memory.
+    """
+    def __init__(self, block, **kwargs):
+        super().__init__(**kwargs)
+        self.block = block
+
+    def call(self, x):
+        return tf.recompute_grad(self.block)(x)
+
+    def get_config(self):
+        config = super().get_config()
+        config["block"] = layers.serialize(self.block)
+        return config
+
+    @classmethod
+    def from_config(cls, config, custom_objects=None):
+        config["block"] = layers.deserialize(config["block"], custom_objects=custom_objects)
+        return cls(**config)
+
+def remat_block(block_fn, x, **kwargs):
+    """
+    Wraps block_fn(x, **kwargs) into its own model so it can be rematerialized.
+    """
+    block_input = layers.Input(shape=x.shape[1:])
+    return Remat(models.Model(block_input, block_fn(block_input, **kwargs)))(x)
+
+class GradientAccumulationModel(models.Model):
+    """
+    Functional model whose train_step sums gradients over accumulation_steps
+    batches before applying them, so the effective batch size is
+    accumulation_steps times the batch that fits in memory.
+    Call build_accumulators() after compile() and before fit().
+    """
+    def __init__(self, *args, accumulation_steps=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accumulation_steps = accumulation_steps
+
+    def build_accumulators(self):
+        # Slot variables can't be created inside the tf.cond in train_step
+        self.optimizer.build(self.trainable_variables)
+        self._accumulated = [tf.Variable(tf.zeros_like(v), trainable=False) for v in self.trainable_variables]
+        self._micro_step = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+    def _apply_accumulated(self):
+        self.optimizer.apply_gradients(zip(self._accumulated, self.trainable_variables))
+        for acc in self._accumulated:
+            acc.assign(tf.zeros_like(acc))
+        return tf.constant(True)
+
+    def train_step(self, data):
+        x, y, sample_weight = tf.keras.utils.unpack_x_y_sample_weight(data)
+        with tf.GradientTape() as tape:
+            y_pred = self(x, training=True)
+            loss = self.compiled_loss(y, y_pred, sample_weight, regularization_losses=self.losses)
+        grads = tape.gradient(loss, self.trainable_variables)
+        for acc, grad in zip(self._accumulated, grads):
+            if grad is not None:
+                acc.assign_add(tf.convert_to_tensor(grad) / self.accumulation_steps)
+        self._micro_step.assign_add(1)
+        tf.cond(self._micro_step % self.accumulation_steps == 0, self._apply_accumulated, lambda: tf.constant(False))
+        self.compiled_metrics.update_state(y, y_pred, sample_weight)
+        return {m.name: m.result() for m in self.metrics}
+
+def plan_training_memory(budget_gb, batch_size, seq_length=16384, num_tracks=4, bfloat16=False):
+    """
+    Picks the cheapest training setup whose estimated activation memory fits
+    budget_gb for an effective batch of batch_size: plain training if the
+    whole batch fits, otherwise per-track rematerialization, with gradient
+    accumulation making up whatever doesn't fit in one micro-batch.
+    Returns a dict with micro_batch_size, accumulation_steps, remat and the
+    estimated bytes per sample.
+    """
+    budget = budget_gb * 1024 ** 3
+    value_bytes = 2 if bfloat16 else 4
+    plans = []
+    for remat in (False, True):
+        track_values = REMAT_TRACK_VALUES_PER_STEP if remat else TRACK_VALUES_PER_STEP
+        per_sample = (num_tracks * track_values + FUSION_VALUES_PER_STEP) * seq_length * value_bytes * BACKWARD_FACTOR
+        # Recomputing one block at a time needs its full activations transiently
+        transient = TRACK_VALUES_PER_STEP * seq_length * value_bytes * BACKWARD_FACTOR if remat else 0
+        micro = max(1, min(batch_size, int(budget // (per_sample + transient))))
+        plans.append({"micro_batch_size": micro, "accumulation_steps": math.ceil(batch_size / micro),
+                      "remat": remat, "bytes_per_sample": per_sample})
+        if micro == batch_size:
+            break
+    return max(plans, key=lambda p: p["micro_batch_size"])
+
+CUSTOM_OBJECTS = {"Remat": Remat}
@@ -0,0 +1,96 @@
+import os
+import uuid
+import hashlib
+import mido
+import numpy as np
+
+NOTE_ON, NOTE_OFF = 1, 2
+MESSAGE_KINDS = {"note_on": NOTE_ON, "note_off": NOTE_OFF}
+
+def is_drum_track(track):
+    for msg in track:
+        if msg.type == 'program_change' and msg.program >= 112 and msg.program <= 127:
+            return True
+        if msg.is_cc(10):
+            return True
+    return False
+
+def midi_to_events(midi_file, track_type):
+    """
+    Parses a MIDI file into an (n_events, 3) int32 array of (note, velocity, time).
+
+    Tracks matching track_type are merged back to back and time is the running
+    tick count over the merged messages; note_off events get velocity 0.
+    """
+    midi = mido.MidiFile(midi_file)
+    messages = [msg for track in midi.tracks if (track_type == "drums") == is_drum_track(track) for msg in track]
+    count = len(messages)
+    kinds = np.fromiter((MESSAGE_KINDS.get(msg.type, 0) for msg in messages), dtype=np.int8, count=count)
+    deltas = np.fromiter((msg.time for msg in messages), dtype=np.int64, count=count)
+    notes = np.fromiter((getattr(msg, "note", 0) for msg in messages), dtype=np.int32, count=count)
+    velocities = np.fromiter((getattr(msg, "velocity", 0) for msg in messages), dtype=np.int32, count=count)
+
+    keep = kinds > 0
+    events = np.empty((int(keep.sum()), 3), dtype=np.int32)
+    events[:, 0] = notes[keep]
+    events[:, 1] = np.where(kinds[keep] == NOTE_ON, velocities[keep], 0)
+    events[:, 2] = np.cumsum(deltas)[keep]
+    return events
+
+def _cache_file(midi_file, track_type, cache_dir, kind):
+    stat = os.stat(midi_file)
+    digest = hashlib.sha1(f"{os.path.abspath(midi_file)}:{track_type}:{kind}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{digest}_{stat.st_mtime_ns}_{stat.st_size}.npy")
+
+def _load_cached(cache_file):
+    try:
+        return np.load(cache_file, mmap_mode="r")
+    except ValueError:
+        # Files with no note events can't be memory-mapped
+        return np.load(cache_file)
+
+def cached_midi_array(midi_file, track_type, kind, compute, cache_dir=None):
+    """
+    Returns compute(midi_file, track_type), cached on disk per MIDI file.
+
+    Cache entries are keyed by path, track type, kind, mtime and size, stored
+    as .npy next to the MIDI files and returned memory-mapped.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(midi_file), ".event_cache")
+    cache_file = _cache_file(midi_file, track_type, cache_dir, kind)
+    if os.path.exists(cache_file):
+        return _load_cached(cache_file)
+
+    array = compute(midi_file, track_type)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Entries for older versions of this file are stale; drop them
+    prefix = os.path.basename(cache_file).split("_", 1)[0]
+    for name in os.listdir(cache_dir):
+        # Never the target itself: another thread may have just published it
+        if name.startswith(prefix + "_") and name.endswith(".npy") and name != os.path.basename(cache_file):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass
+    # Unique per writer, so concurrent threads of one process don't share a temp file
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_file, cache_file)
+    return _load_cached(cache_file)
+
+def load_midi_events(midi_file, track_type, cache_dir=None):
+    """
+    midi_to_events with a per-file on-disk cache.
+    """
+    return cached_midi_array(midi_file, track_type, "events", midi_to_events, cache_dir)
+
+def pad_events(events, sequence_length):
+    """
+    Zero-pads or truncates an event array to exactly sequence_length rows.
+    """
+    sequence = np.zeros((sequence_length, events.shape[1]), dtype=events.dtype)
+    n = min(len(events), sequence_length)
+    sequence[:n] = events[:n]
+    return sequence
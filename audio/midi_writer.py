@@ -0,0 +1,116 @@
+import struct
+import numpy as np
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+# Semitones above the root for extract_chord_progression's chord qualities
+CHORD_INTERVALS = {"": (0, 4, 7), "m": (0, 3, 7), "7": (0, 4, 7, 10), "m7": (0, 3, 7, 10)}
+
+def encode_vlq(values):
+    """
+    MIDI variable-length quantities for an array of ticks. Every value is
+    spread over four 7-bit slots, most significant first; returns the (n, 4)
+    uint8 slots and a mask of the ones actually written.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    shifts = np.array([21, 14, 7, 0])
+    groups = (values[:, None] >> shifts) & 0x7F
+    groups[:, :3] |= 0x80
+    n_bytes = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    mask = np.arange(4)[None, :] >= 4 - n_bytes[:, None]
+    return groups.astype(np.uint8), mask
+
+def notes_to_events(pitches, velocities, starts, durations, channel=0):
+    """
+    Note arrays (ticks) to a time-sorted event stream: (delta, status, data1,
+    data2) columns. Note-offs sort before note-ons on the same tick so a
+    repeated pitch isn't cut short.
+    """
+    pitches = np.clip(np.asarray(pitches, dtype=np.int64), 0, 127)
+    velocities = np.clip(np.asarray(velocities, dtype=np.int64), 1, 127)
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), 0)
+    ends = starts + np.maximum(np.asarray(durations, dtype=np.int64), 1)
+
+    times = np.concatenate([ends, starts])
+    is_on = np.concatenate([np.zeros(len(ends), dtype=np.int64), np.ones(len(starts), dtype=np.int64)])
+    order = np.lexsort((is_on, times))
+    times, is_on = times[order], is_on[order]
+    status = np.where(is_on, 0x90, 0x80) | (channel & 0x0F)
+    data1 = np.concatenate([pitches, pitches])[order]
+    data2 = np.where(is_on, np.concatenate([velocities, velocities])[order], 0)
+    deltas = np.diff(times, prepend=0)
+    return np.stack([deltas, status, data1, data2], axis=1)
+
+def meta_event(kind, data):
+    groups, mask = encode_vlq([len(data)])
+    return b"\x00\xff" + bytes([kind]) + groups[mask].tobytes() + data
+
+def track_chunk(events, name=None, tempo=None):
+    """
+    One MTrk chunk; the channel events are serialized in a single masked
+    gather rather than message by message.
+    """
+    body = b""
+    if name is not None:
+        body += meta_event(0x03, name.encode("utf-8"))
+    if tempo is not None:
+        body += meta_event(0x51, struct.pack(">I", int(round(60_000_000 / tempo)))[1:])
+    if len(events):
+        groups, mask = encode_vlq(events[:, 0])
+        rows = np.concatenate([groups, events[:, 1:].astype(np.uint8)], axis=1)
+        body += rows[np.concatenate([mask, np.ones((len(events), 3), dtype=bool)], axis=1)].tobytes()
+    body += b"\x00\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">I", len(body)) + body
+
+def write_midi(path, tracks, tempo=120, ticks_per_beat=480):
+    """
+    Writes a format 1 MIDI file. tracks is a list of dicts with name,
+    pitches, velocities, starts and durations (ticks) and optionally channel.
+    """
+    chunks = [b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), ticks_per_beat)]
+    for i, track in enumerate(tracks):
+        events = notes_to_events(track["pitches"], track["velocities"], track["starts"], track["durations"],
+                                 channel=track.get("channel", 0))
+        chunks.append(track_chunk(events, name=track.get("name"), tempo=tempo if i == 0 else None))
+    with open(path, "wb") as f:
+        f.write(b"".join(chunks))
+    return path
+
+def steps_to_track(steps, ticks_per_beat=480, name=None):
+    """
+    Generated (n, 3) note/velocity/duration steps, all in [0, 1], to a track
+    of back-to-back notes. Steps with no note or velocity are rests of zero
+    length; a zero duration falls back to a sixteenth note.
+    """
+    steps = np.asarray(steps, dtype=np.float64)
+    pitches = (steps[:, 0] * 127).astype(np.int64)
+    velocities = (steps[:, 1] * 127).astype(np.int64)
+    durations = (steps[:, 2] * ticks_per_beat / 4).astype(np.int64)
+    keep = (pitches > 0) & (velocities > 0)
+    pitches, velocities, durations = pitches[keep], velocities[keep], durations[keep]
+    durations = np.where(durations > 0, durations, ticks_per_beat // 4)
+    starts = np.cumsum(durations) - durations
+    return {"name": name, "pitches": pitches, "velocities": velocities, "starts": starts, "durations": durations}
+
+def chords_to_track(chords, tempo=120, ticks_per_beat=480, octave=4, velocity=80, name="Chords"):
+    """
+    extract_chord_progression output (root, quality, start_time, end_time
+    in seconds) to a track of block chords.
+    """
+    if not chords:
+        empty = np.zeros(0, dtype=np.int64)
+        return {"name": name, "pitches": empty, "velocities": empty, "starts": empty, "durations": empty}
+    ticks_per_second = ticks_per_beat * tempo / 60
+    roots = np.array([NOTE_NAMES.index(c["root"]) for c in chords]) + 12 * (octave + 1)
+    starts = np.round(np.array([c["start_time"] for c in chords]) * ticks_per_second).astype(np.int64)
+    ends = np.round(np.array([c["end_time"] for c in chords]) * ticks_per_second).astype(np.int64)
+    # Each chord sounds until the next one starts (the progression is simplified to changes)
+    ends = np.maximum(np.append(starts[1:], ends[-1]), starts + 1)
+    counts = np.array([len(CHORD_INTERVALS.get(c["quality"], CHORD_INTERVALS[""])) for c in chords])
+    intervals = np.concatenate([CHORD_INTERVALS.get(c["quality"], CHORD_INTERVALS[""]) for c in chords])
+    return {
+        "name": name,
+        "pitches": np.repeat(roots, counts) + intervals,
+        "velocities": np.full(counts.sum(), velocity),
+        "starts": np.repeat(starts, counts),
+        "durations": np.repeat(ends - starts, counts),
+    }
@@ -0,0 +1,152 @@
+import math
+import numpy as np
+
+STEM_NAMES = ["vocals", "drums", "bass", "other"]
+DEFAULT_GAINS = {"vocals": 0.4, "drums": 0.2, "bass": 0.2, "other": 0.2}
+
+def mix_matrix(gains, pans=None):
+    """
+    (channels, stems) matrix: a row of gains for mono, or constant-power
+    panned left/right rows when pans (-1 left .. 1 right) are given.
+    """
+    gains = np.asarray(gains, dtype=np.float32)
+    if pans is None:
+        return gains[None]
+    angles = (np.asarray(pans, dtype=np.float32) + 1) * np.pi / 4
+    return np.stack([gains * np.cos(angles), gains * np.sin(angles)])
+
+def resample_filter(up, down, half_width=10, beta=5.0):
+    """
+    Kaiser-windowed sinc low-pass for polyphase resampling, at the upsampled
+    rate; odd length, so its centre tap lines output j up with input j * down / up.
+    """
+    cutoff = 1.0 / max(up, down)
+    half = half_width * max(up, down)
+    t = np.arange(-half, half + 1)
+    return (up * cutoff * np.sinc(cutoff * t) * np.kaiser(2 * half + 1, beta)).astype(np.float32)
+
+def resample(audio, orig_sr, target_sr, block=1 << 16):
+    """
+    Polyphase resampling of (channels, samples) audio along the last axis.
+    Output j is the dot product of the filter phase it falls on with the
+    few input samples under it, so the cost is O(output samples * taps per
+    phase) whatever the ratio; outputs are computed block samples at a time.
+    """
+    if orig_sr == target_sr:
+        return audio
+    g = math.gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // g, int(orig_sr) // g
+    h = resample_filter(up, down)
+    taps = -(-len(h) // up)
+    # bank[r] holds taps h[r], h[r + up], ... reversed, so it lines up with inputs in time order
+    bank = np.zeros(taps * up, dtype=np.float32)
+    bank[:len(h)] = h
+    bank = bank.reshape(taps, up).T[:, ::-1]
+    n = audio.shape[-1]
+    out_len = -(-n * up // down)
+    out = np.empty(audio.shape[:-1] + (out_len,), dtype=np.float32)
+    for c in range(audio.shape[0]):
+        # Zero history before the signal and past its end, so every output sees a full window
+        padded = np.concatenate([np.zeros(taps - 1, dtype=np.float32), np.asarray(audio[c], dtype=np.float32),
+                                 np.zeros(len(h) // (2 * up) + 2, dtype=np.float32)])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, taps)
+        for start in range(0, out_len, block):
+            # Position of each output on the upsampled grid, counted from the filter's first tap
+            m = len(h) // 2 + np.arange(start, min(start + block, out_len)) * down
+            out[c, start:start + len(m)] = np.einsum("jt,jt->j", windows[m // up], bank[m % up])
+    return out
+
+def _sliding(op, x, size, fill):
+    """
+    op (np.maximum or np.minimum) over forward windows x[..., i:i + size],
+    padding the end with fill; O(n log size) by doubling the window span.
+    """
+    out = np.concatenate([x, np.full(x.shape[:-1] + (size - 1,), fill, dtype=x.dtype)], axis=-1)
+    span = 1
+    while span < size:
+        step = min(span, size - span)
+        out = op(out[..., :-step], out[..., step:])
+        span += step
+    return out
+
+def limit(audio, threshold=0.98, lookahead=64):
+    """
+    Lookahead peak limiter for (channels, samples) audio. The gain at t is
+    the average over the previous lookahead samples of the lowest gain any
+    peak in the next lookahead samples needs, so it ramps down ahead of a
+    peak and never lets it exceed threshold. Channels share one gain.
+    """
+    if lookahead < 1:
+        return np.clip(audio, -threshold, threshold)
+    peak = np.abs(audio).max(axis=0)
+    # Unity gain before the start, so the ramp into an early peak is complete too
+    needed = np.concatenate([np.ones(lookahead), np.minimum(1.0, threshold / np.maximum(peak, 1e-12))])
+    floor = _sliding(np.minimum, needed, lookahead + 1, 1.0)
+    # Moving average of floor over [t - lookahead, t]
+    sums = np.concatenate([[0.0], np.cumsum(floor)])
+    gain = (sums[lookahead + 1:] - sums[:-lookahead - 1]) / (lookahead + 1)
+    return (audio * gain.astype(np.float32)).astype(np.float32)
+
+def mix(stems, gains=None, pans=None, orig_sr=24000, target_sr=None, threshold=0.98, lookahead=64):
+    """
+    Mixes (stems, samples) audio to mono (samples,) or, with pans, stereo
+    (2, samples): per-stem gains in one matrix product, then a single
+    resample of the mix to target_sr, then the limiter.
+    """
+    gains = [DEFAULT_GAINS[s] for s in STEM_NAMES] if gains is None else gains
+    mixed = mix_matrix(gains, pans) @ np.asarray(stems, dtype=np.float32)
+    mixed = resample(mixed, orig_sr, target_sr or orig_sr)
+    mixed = limit(mixed, threshold, lookahead) if threshold else mixed
+    return mixed[0] if pans is None else mixed
+
+class StreamingMixer:
+    """
+    Chunk-wise mix(): push() (stems, samples) chunks and get back every
+    output sample that no longer depends on future input; flush() returns
+    the rest. The concatenated output matches mix() on the whole signal.
+    Each push recomputes only a short window of retained history.
+    """
+    def __init__(self, gains=None, pans=None, orig_sr=24000, target_sr=None, threshold=0.98, lookahead=64):
+        self.gains = [DEFAULT_GAINS[s] for s in STEM_NAMES] if gains is None else gains
+        self.pans = pans
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr or orig_sr
+        self.threshold = threshold
+        self.lookahead = lookahead
+        g = math.gcd(int(orig_sr), int(self.target_sr))
+        self.up, self.down = int(self.target_sr) // g, int(orig_sr) // g
+        # Input samples an output sample depends on either side: resampler taps plus limiter lookahead
+        self.reach = (10 * max(self.up, self.down)) // self.up + 2 + -(-lookahead * self.down // self.up)
+        self._buffer = None
+        self._start = 0  # absolute input index of _buffer[0], kept a multiple of down
+        self._emitted = 0  # absolute index of the next output sample
+        self._total = 0
+
+    def _render(self):
+        mixed = mix_matrix(self.gains, self.pans) @ self._buffer
+        mixed = resample(mixed, self.orig_sr, self.target_sr)
+        return limit(mixed, self.threshold, self.lookahead) if self.threshold else mixed
+
+    def _emit(self, end):
+        out_start = self._start * self.up // self.down
+        rendered = self._render()
+        chunk = rendered[..., self._emitted - out_start:end - out_start]
+        self._emitted = max(self._emitted, end)
+        # Keep enough input behind the next output sample for its left context
+        keep_from = (self._emitted * self.down // self.up - 2 * self.reach) // self.down * self.down
+        if keep_from > self._start:
+            self._buffer = self._buffer[:, keep_from - self._start:]
+            self._start = keep_from
+        return chunk[0] if self.pans is None else chunk
+
+    def push(self, stems):
+        stems = np.asarray(stems, dtype=np.float32)
+        self._buffer = stems if self._buffer is None else np.concatenate([self._buffer, stems], axis=1)
+        self._total += stems.shape[1]
+        ready = max((self._total - 2 * self.reach) * self.up // self.down, self._emitted)
+        return self._emit(ready)
+
+    def flush(self):
+        if self._buffer is None:
+            return np.zeros(0 if self.pans is None else (2, 0), dtype=np.float32)
+        return self._emit(-(-self._total * self.up // self.down))
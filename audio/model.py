@@ -3,167 +3,392 @@ from tensorflow.keras import layers, models
 from loguru import logger
 import os
 import glob
-import mido
+import argparse
 import numpy as np
-from music21 import chord, scale, key, stream
+from midi_events import load_midi_events, pad_events
+from music_theory import load_theory_encoding
+from packing import DEFAULT_BUCKETS, plan_batches
+from hyena import HyenaOperator
+from memory import GradientAccumulationModel, plan_training_memory, remat_block
+from streaming import StreamingConv1D
+from segments import SegmentCausalConv1D, segment_recurrent
 
 LOG_FILE = os.path.join("$LOG_DIR", "model.log")
 logger.add(LOG_FILE, rotation="500 MB")
 
-def is_drum_track(track):
-    for msg in track:
-        if msg.type == 'program_change' and msg.program >= 112 and msg.program <= 127:
-            return True
-        if msg.is_cc(10):
-            return True
-    return False
-
-def load_midi_data(midi_dir, track_type):
-    midi_files = glob.glob(f"{midi_dir}/*_{track_type}.mid")
+def load_midi_data(midi_dir, track_type, sequence_length=16384):
+    midi_files = sorted(glob.glob(f"{midi_dir}/*_{track_type}.mid"))
     sequences = []
     for midi_file in midi_files:
         try:
-            midi = mido.MidiFile(midi_file)
-            tracks = [track for track in midi.tracks if (track_type == "drums") == is_drum_track(track)]
-            merged_track = mido.MidiTrack()
-            for track in tracks:
-                merged_track.extend(track)
-            
-            notes, velocities, times = [], [], []
-            time = 0
-            for msg in merged_track:
-                time += msg.time
-                if msg.type == 'note_on':
-                    notes.append(msg.note)
-                    velocities.append(msg.velocity)
-                    times.append(time)
-                elif msg.type == 'note_off':
-                    notes.append(msg.note)
-                    velocities.append(0)
-                    times.append(time)
-            
-            sequence_length = 16384
-            if len(notes) < sequence_length:
-                notes += [0] * (sequence_length - len(notes))
-                velocities += [0] * (sequence_length - len(velocities))
-                times += [0] * (sequence_length - len(times))
-            else:
-                notes = notes[:sequence_length]
-                velocities = velocities[:sequence_length]
-                times = times[:sequence_length]
-            
-            sequence = np.array([notes, velocities, times]).T
-            sequences.append(sequence)
+            sequences.append(pad_events(load_midi_events(midi_file, track_type), sequence_length))
         except Exception as e:
             logger.error(f"Error processing {midi_file}: {e}")
     return np.array(sequences)
 
-def load_spectrogram_data(spec_dir, track_type):
-    spec_files = glob.glob(f"{spec_dir}/*_{track_type}.npy")
-    sequences = []
-    for spec_file in spec_files:
-        spec = np.load(spec_file)
-        sequence_length = 16384
-        if spec.shape[1] < sequence_length:
-            spec = np.pad(spec, ((0, 0), (0, sequence_length - spec.shape[1])), mode='constant')
-        else:
-            spec = spec[:, :sequence_length]
-        sequences.append(spec.T)
-    return np.array(sequences)
+def spectrogram_window(spec, sequence_length=16384):
+    # (n_mels, frames) -> zero-padded (sequence_length, n_mels); reads only the frames inside the window
+    window = np.zeros((sequence_length, spec.shape[0]), dtype=np.float32)
+    n = min(spec.shape[1], sequence_length)
+    window[:n] = spec[:, :n].T
+    return window
+
+def load_spectrogram_window(spec_file, sequence_length=16384):
+    # Memory-mapped so only the frames inside the window are read
+    return spectrogram_window(np.load(spec_file, mmap_mode='r'), sequence_length)
+
+def load_spectrogram_data(spec_dir, track_type, sequence_length=16384):
+    spec_files = sorted(glob.glob(f"{spec_dir}/*_{track_type}.npy"))
+    return np.array([load_spectrogram_window(spec_file, sequence_length) for spec_file in spec_files])
 
-def encode_music_theory(midi_data, track_type):
-    # Analyze MIDI for key, scale, and chords using music21
-    s = stream.Stream()
-    for note, vel, time in midi_data.T[:3]:  # Use first 3 columns (notes, velocities, times)
-        if vel > 0 and note > 0:
-            s.append(note.Note(note, quarterLength=time/480))  # Assume 120 BPM, 480 ticks/quarter
-    k = s.analyze('key')
-    scale_obj = scale.MajorScale(k.tonic)
-    chords = [c for c in s.chordify().getElementsByClass(chord.Chord)]
-    # Encode as one-hot vectors or embeddings
-    key_encoding = np.zeros(12)  # 12 semitones for key
-    key_encoding[k.tonic.pitchClass] = 1
-    scale_encoding = np.zeros(len(scale_obj.pitches))  # Simplified scale encoding
-    for p in scale_obj.pitches:
-        scale_encoding[p.pitchClass] = 1
-    chord_encoding = np.zeros(48)  # 4 common chord types (major, minor, etc.) per key
-    for c in chords[:16]:  # Limit to first 16 chords for sequence length
-        if c.isMajorTriad():
-            chord_encoding[c.root().pitchClass * 4] = 1
-        elif c.isMinorTriad():
-            chord_encoding[c.root().pitchClass * 4 + 1] = 1
-    return np.concatenate([key_encoding, scale_encoding, chord_encoding])
-
-def striped_hyena_layer(inputs, filters, kernel_size=3):
-    conv = layers.Conv1D(filters, kernel_size, padding='causal', activation='relu')(inputs)
-    gate = layers.Conv1D(filters, kernel_size, padding='causal', activation='sigmoid')(inputs)
+def causal_conv(inputs, filters, kernel_size, activation, stateful_batch_size=None, resets=None):
+    # Stateful variant carries its receptive field across chunks (incremental inference)
+    if stateful_batch_size and kernel_size > 1:
+        return StreamingConv1D(filters, kernel_size, batch_size=stateful_batch_size, activation=activation)(inputs)
+    # Segmented variant doesn't reach back across packed segment starts
+    if resets is not None and kernel_size > 1:
+        return SegmentCausalConv1D(filters, kernel_size, activation=activation)([inputs, resets])
+    return layers.Conv1D(filters, kernel_size, padding='causal', activation=activation)(inputs)
+
+def striped_hyena_layer(inputs, filters, kernel_size=3, long_conv=False, stateful_batch_size=None, resets=None):
+    conv = causal_conv(inputs, filters, kernel_size, 'relu', stateful_batch_size, resets)
+    gate = causal_conv(inputs, filters, kernel_size, 'sigmoid', stateful_batch_size, resets)
     gated_conv = layers.Multiply()([conv, gate])
-    recurrent = layers.SimpleRNN(filters, return_sequences=True)(gated_conv)
+    if long_conv:
+        # FFT long convolution: O(L log L) and parallel over the sequence
+        recurrent = HyenaOperator(filters)(gated_conv)
+    elif resets is not None:
+        recurrent = segment_recurrent(layers.SimpleRNNCell(filters), gated_conv, resets)
+    else:
+        recurrent = layers.SimpleRNN(filters, return_sequences=True, stateful=bool(stateful_batch_size))(gated_conv)
     return layers.Add()([gated_conv, recurrent])
 
-def build_hybrid_music_generator(seq_length=16384, n_mels=128, feature_dim=3, num_tracks=4):
+def midi_track_block(track_input, feature_dim=3, long_conv=False, stateful_batch_size=None, packed=False):
+    # Packed models carry the segment resets as the track input's last channel
+    resets = track_input[:, :, -1:] if packed else None
+    track_input = track_input[:, :, :-1] if packed else track_input
+    x = layers.Embedding(128, 32)(tf.cast(track_input[:, :, 0], dtype=tf.int32))
+    x = layers.Concatenate()([x, track_input[:, :, 1:]])
+    x = striped_hyena_layer(x, 256, long_conv=long_conv, stateful_batch_size=stateful_batch_size, resets=resets)
+    x = striped_hyena_layer(x, 128, long_conv=long_conv, stateful_batch_size=stateful_batch_size, resets=resets)
+    return layers.Dense(feature_dim, activation='linear')(x)
+
+def spec_track_block(track_input, n_mels=128, stateful_batch_size=None, packed=False):
+    resets = track_input[:, :, -1:] if packed else None
+    track_input = track_input[:, :, :-1] if packed else track_input
+    x = causal_conv(track_input, 256, 3, 'relu', stateful_batch_size, resets)
+    if packed:
+        x = segment_recurrent(layers.LSTMCell(128), x, resets)
+    else:
+        x = layers.LSTM(128, return_sequences=True, stateful=bool(stateful_batch_size))(x)
+    return layers.Conv1D(n_mels, 1, activation='linear')(x)
+
+def build_hybrid_music_generator(seq_length=16384, n_mels=128, feature_dim=3, num_tracks=4, long_conv=False,
+                                 remat=False, accumulation_steps=None, stateful_batch_size=None, packed=False):
+    """
+    With stateful_batch_size set, builds the chunked-inference variant: inputs
+    of any length, causal convolutions that buffer their receptive field and
+    stateful RNN/LSTM layers, so a sequence can be fed a chunk at a time.
+
+    packed builds the variant for packed training windows: a (steps, 64)
+    theory input so each packed song has its own encoding, and a (steps, 1)
+    resets input, 1 on the first step of every song, at which the causal
+    convolutions stop reaching back and the RNN/LSTM states restart. Each
+    song's outputs are then exactly those of the song on its own; see
+    generator_inputs() for feeding it unpacked sequences.
+    """
+    if stateful_batch_size and long_conv:
+        raise ValueError("Stateful inference isn't supported with long_conv")
+    if packed and long_conv:
+        # The FFT long convolution spans the whole window, across packed songs
+        raise ValueError("Packed training isn't supported with long_conv")
+    if stateful_batch_size:
+        seq_length = None
+
+    # Per-track blocks, rematerialized during backprop when remat is set
+    def track_block(block_fn, x, **kwargs):
+        return remat_block(block_fn, x, **kwargs) if remat else block_fn(x, **kwargs)
+
     # MIDI input (notes, velocities, times)
-    midi_input = layers.Input(shape=(seq_length, feature_dim * num_tracks))
+    midi_input = layers.Input(shape=(seq_length, feature_dim * num_tracks), batch_size=stateful_batch_size)
     # Spectrogram input (Mel spectrograms)
-    spec_input = layers.Input(shape=(seq_length, n_mels * num_tracks))
+    spec_input = layers.Input(shape=(seq_length, n_mels * num_tracks), batch_size=stateful_batch_size)
     # Music theory input (key, scale, chords)
-    theory_input = layers.Input(shape=(64,))  # Encoded music theory (key, scale, chords)
+    theory_shape = (seq_length, 64) if packed else (64,)
+    theory_input = layers.Input(shape=theory_shape, batch_size=stateful_batch_size)  # Encoded music theory (key, scale, chords)
+    inputs = [midi_input, spec_input, theory_input]
+    if packed:
+        resets_input = layers.Input(shape=(seq_length, 1))
+        inputs.append(resets_input)
     
     # Process MIDI
     midi_outputs = []
     for i in range(num_tracks):
         track_input = midi_input[:, :, i*feature_dim:(i+1)*feature_dim]
-        x = layers.Embedding(128, 32)(tf.cast(track_input[:, :, 0], dtype=tf.int32))
-        x = layers.Concatenate()([x, track_input[:, :, 1:]])
-        x = striped_hyena_layer(x, 256)
-        x = striped_hyena_layer(x, 128)
-        midi_outputs.append(layers.Dense(feature_dim, activation='linear')(x))
+        if packed:
+            track_input = layers.Concatenate()([track_input, resets_input])
+        midi_outputs.append(track_block(midi_track_block, track_input, feature_dim=feature_dim, long_conv=long_conv,
+                                        stateful_batch_size=stateful_batch_size, packed=packed))
     midi_fused = layers.Concatenate(axis=-1)(midi_outputs)
     
     # Process spectrograms
     spec_outputs = []
     for i in range(num_tracks):
         track_input = spec_input[:, :, i*n_mels:(i+1)*n_mels]
-        x = layers.Conv1D(256, 3, padding='causal', activation='relu')(track_input)
-        x = layers.LSTM(128, return_sequences=True)(x)
-        spec_outputs.append(layers.Conv1D(n_mels, 1, activation='linear')(x))
+        if packed:
+            track_input = layers.Concatenate()([track_input, resets_input])
+        spec_outputs.append(track_block(spec_track_block, track_input, n_mels=n_mels,
+                                        stateful_batch_size=stateful_batch_size, packed=packed))
     spec_fused = layers.Concatenate(axis=-1)(spec_outputs)
     
     # Incorporate music theory
     theory_dense = layers.Dense(64, activation='relu')(theory_input)
-    theory_expanded = layers.RepeatVector(seq_length)(theory_dense)
+    if packed:
+        theory_expanded = theory_dense
+    elif seq_length is None:
+        # Variable-length windows: tile to the input's length
+        theory_expanded = layers.Lambda(
+            lambda t: tf.repeat(t[0][:, None, :], tf.shape(t[1])[1], axis=1))([theory_dense, midi_input])
+    else:
+        theory_expanded = layers.RepeatVector(seq_length)(theory_dense)
     theory_processed = layers.Conv1D(128, 1, activation='relu')(theory_expanded)
     
     # Fusion
     fused = layers.Concatenate(axis=-1)([midi_fused, spec_fused, theory_processed])
-    final_output = layers.Conv1D(feature_dim * num_tracks, 1, activation='linear')(fused)
+    # float32 output keeps the loss stable under a mixed_bfloat16 policy
+    final_output = layers.Conv1D(feature_dim * num_tracks, 1, activation='linear', dtype='float32')(fused)
     
-    return models.Model([midi_input, spec_input, theory_input], final_output, name="hybrid_music_generator")
+    if accumulation_steps:
+        return GradientAccumulationModel(inputs, final_output,
+                                         accumulation_steps=accumulation_steps, name="hybrid_music_generator")
+    return models.Model(inputs, final_output, name="hybrid_music_generator")
+
+def generator_inputs(model, midi, spec, theory):
+    """
+    Model inputs for unpacked (batch, steps, ...) midi and spec and a
+    (batch, 64) theory vector: a packed-trained model also gets per-step
+    theory and a single segment starting at step 0.
+    """
+    if len(model.inputs) == 3:
+        return [midi, spec, theory]
+    steps = midi.shape[1]
+    resets = np.zeros((midi.shape[0], steps, 1), dtype=np.float32)
+    resets[:, 0] = 1
+    return [midi, spec, np.repeat(np.asarray(theory)[:, None], steps, axis=1), resets]
+
+def build_streaming_generator(model, batch_size=1, n_mels=128, feature_dim=3, num_tracks=4):
+    """
+    Stateful copy of a trained hybrid generator for chunked inference, or None
+    if its weights don't line up (long_conv, remat or packed checkpoints).
+    """
+    if len(model.inputs) != 3:
+        return None
+    try:
+        streaming = build_hybrid_music_generator(n_mels=n_mels, feature_dim=feature_dim, num_tracks=num_tracks,
+                                                 stateful_batch_size=batch_size)
+    except ValueError:
+        return None
+    src, dst = model.trainable_weights, streaming.trainable_weights
+    if [w.shape for w in src] != [w.shape for w in dst]:
+        return None
+    for d, w in zip(dst, src):
+        d.assign(w)
+    return streaming
+
+def find_training_samples(midi_dir, spec_dir, track_types):
+    """
+    Song IDs that have a MIDI file and a spectrogram for every track type.
+    """
+    song_ids = None
+    for t in track_types:
+        midi_ids = {os.path.basename(f)[:-len(f"_{t}.mid")] for f in glob.glob(f"{midi_dir}/*_{t}.mid")}
+        spec_ids = {os.path.basename(f)[:-len(f"_{t}.npy")] for f in glob.glob(f"{spec_dir}/*_{t}.npy")}
+        ids = midi_ids & spec_ids
+        song_ids = ids if song_ids is None else song_ids & ids
+    return sorted(song_ids or [])
+
+def _fit_rows(rows, length):
+    out = np.zeros((length, rows.shape[1]), dtype=np.float32)
+    out[:len(rows)] = rows[:length]
+    return out
+
+def load_song(song_id, midi_dir, spec_dir, track_types):
+    """
+    ({track_type: (events, spec)}, theory) for one song: the cached MIDI
+    event arrays, memory-mapped (n_mels, frames) spectrograms and the
+    song's theory vector.
+    """
+    tracks, theory = {}, np.zeros(64, dtype=np.float32)
+    for t in track_types:
+        midi_file = os.path.join(midi_dir, f"{song_id}_{t}.mid")
+        spec = np.load(os.path.join(spec_dir, f"{song_id}_{t}.npy"), mmap_mode='r')
+        tracks[t] = (load_midi_events(midi_file, t), spec)
+        # The model takes a single theory vector per song: union over its tracks
+        theory = np.maximum(theory, load_theory_encoding(midi_file, t))
+    return tracks, theory.astype(np.float32)
+
+def song_window(tracks, track_types, length, offset=0):
+    """
+    (midi, spec) for steps offset to offset + length of a song read with
+    load_song, zero-padded: (length, 3 * tracks) and (length, n_mels * tracks).
+    Only the spectrogram frames inside the window are read.
+    """
+    midi = [_fit_rows(tracks[t][0][offset:offset + length], length) for t in track_types]
+    spec = [_fit_rows(tracks[t][1][:, offset:offset + length].T, length) for t in track_types]
+    return np.concatenate(midi, axis=-1), np.concatenate(spec, axis=-1)
+
+def load_training_sample(song_id, midi_dir, spec_dir, track_types, seq_length=16384):
+    """
+    Reads one (midi, spec, theory) training example from disk.
+    """
+    tracks, theory = load_song(song_id, midi_dir, spec_dir, track_types)
+    return (*song_window(tracks, track_types, seq_length), theory)
 
-def train_model():
-    model = build_hybrid_music_generator()
+def make_training_dataset(midi_dir, spec_dir, track_types, seq_length=16384, n_mels=128, batch_size=2,
+                          shuffle_buffer=64, feature_dim=3):
+    """
+    Streaming tf.data pipeline: songs are read lazily and decoded in parallel,
+    shuffled through a bounded buffer and prefetched batch by batch, so memory
+    use is independent of catalog size.
+    """
+    song_ids = find_training_samples(midi_dir, spec_dir, track_types)
+    num_tracks = len(track_types)
+
+    def load(song_id):
+        return load_training_sample(song_id.decode("utf-8"), midi_dir, spec_dir, track_types, seq_length)
+
+    def to_example(song_id):
+        midi, spec, theory = tf.numpy_function(load, [song_id], [tf.float32, tf.float32, tf.float32])
+        midi = tf.ensure_shape(midi, (seq_length, feature_dim * num_tracks))
+        spec = tf.ensure_shape(spec, (seq_length, n_mels * num_tracks))
+        theory = tf.ensure_shape(theory, (64,))
+        return (midi, spec, theory), midi
+
+    dataset = tf.data.Dataset.from_tensor_slices(song_ids)
+    dataset = dataset.shuffle(max(len(song_ids), 1), reshuffle_each_iteration=True)
+    dataset = dataset.map(to_example, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    dataset = dataset.shuffle(shuffle_buffer)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE), len(song_ids)
+
+def song_length(song_id, midi_dir, spec_dir, track_types):
+    """
+    Number of steps in a song: the longest MIDI event list or spectrogram
+    over its tracks. Reads only cached event arrays and .npy headers.
+    """
+    length = 0
+    for t in track_types:
+        length = max(length, len(load_midi_events(os.path.join(midi_dir, f"{song_id}_{t}.mid"), t)),
+                     np.load(os.path.join(spec_dir, f"{song_id}_{t}.npy"), mmap_mode='r').shape[1])
+    return length
+
+def load_packed_window(window, window_length, midi_dir, spec_dir, track_types):
+    """
+    Reads a packed window: its segments laid end to end and zero-padded to
+    window_length. Returns (midi, spec, theory, resets, weights): theory is
+    per step, each segment carrying its own song's encoding; resets is 1 on
+    the first step of every segment (and of the padding); weights is 1 on
+    real steps and 0 on padding.
+    """
+    midi_parts, spec_parts, theory_parts = [], [], []
+    resets = np.zeros((window_length, 1), dtype=np.float32)
+    start = 0
+    for song_id, offset, length in window:
+        tracks, theory = load_song(song_id, midi_dir, spec_dir, track_types)
+        midi, spec = song_window(tracks, track_types, length, offset)
+        midi_parts.append(midi)
+        spec_parts.append(spec)
+        theory_parts.append(np.repeat(theory[None], length, axis=0))
+        resets[start] = 1
+        start += length
+    midi = _fit_rows(np.concatenate(midi_parts), window_length)
+    spec = _fit_rows(np.concatenate(spec_parts), window_length)
+    theory = _fit_rows(np.concatenate(theory_parts), window_length)
+    if start < window_length:
+        resets[start] = 1
+    weights = np.zeros(window_length, dtype=np.float32)
+    weights[:start] = 1
+    return midi, spec, theory, resets, weights
+
+def make_packed_dataset(midi_dir, spec_dir, track_types, n_mels=128, batch_size=2, buckets=DEFAULT_BUCKETS,
+                        feature_dim=3, seed=0):
+    """
+    Length-bucketed alternative to make_training_dataset. Long songs are sliced
+    into several windows, short ones are packed together, and each batch is
+    padded only to its bucket length with padding masked via sample weights.
+    Train it with a model built with seq_length=None and packed=True.
+    """
+    song_ids = find_training_samples(midi_dir, spec_dir, track_types)
+    lengths = {song_id: song_length(song_id, midi_dir, spec_dir, track_types) for song_id in song_ids}
+    batches = plan_batches(lengths, batch_size, buckets=buckets, seed=seed)
+    num_tracks = len(track_types)
+
+    def load(index):
+        window_length, windows = batches[index]
+        examples = [load_packed_window(w, window_length, midi_dir, spec_dir, track_types) for w in windows]
+        return tuple(np.stack(part) for part in zip(*examples))
+
+    def to_batch(index):
+        midi, spec, theory, resets, weights = tf.numpy_function(
+            load, [index], [tf.float32, tf.float32, tf.float32, tf.float32, tf.float32])
+        midi = tf.ensure_shape(midi, (None, None, feature_dim * num_tracks))
+        spec = tf.ensure_shape(spec, (None, None, n_mels * num_tracks))
+        theory = tf.ensure_shape(theory, (None, None, 64))
+        resets = tf.ensure_shape(resets, (None, None, 1))
+        weights = tf.ensure_shape(weights, (None, None))
+        return (midi, spec, theory, resets), midi, weights
+
+    dataset = tf.data.Dataset.range(len(batches))
+    dataset = dataset.shuffle(max(len(batches), 1), reshuffle_each_iteration=True)
+    dataset = dataset.map(to_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    return dataset.prefetch(tf.data.AUTOTUNE), len(song_ids)
+
+def train_model(batch_size=2, epochs=20, shuffle_buffer=64, packed=False, long_conv=False,
+                memory_budget_gb=None, bfloat16=False):
+    """
+    batch_size is the effective batch size. With memory_budget_gb set, the
+    batch is split into micro-batches with gradient accumulation and the
+    per-track blocks are rematerialized as needed to fit the budget.
+    """
+    if bfloat16:
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    remat, accumulation_steps = False, None
+    if memory_budget_gb:
+        plan = plan_training_memory(memory_budget_gb, batch_size, bfloat16=bfloat16)
+        logger.info(f"Memory plan for {memory_budget_gb} GB: {plan}")
+        batch_size, remat = plan["micro_batch_size"], plan["remat"]
+        if plan["accumulation_steps"] > 1:
+            accumulation_steps = plan["accumulation_steps"]
+
+    model = build_hybrid_music_generator(seq_length=None if packed else 16384, long_conv=long_conv,
+                                         remat=remat, accumulation_steps=accumulation_steps, packed=packed)
     model.compile(optimizer='adam', loss='mse')
+    if accumulation_steps:
+        model.build_accumulators()
     track_types = ["vocals", "drums", "bass", "other"]
-    
-    # Load MIDI and spectrogram data
-    midi_data = np.concatenate([load_midi_data("$MIDI_DIR", t) for t in track_types], axis=-1)
-    spec_data = np.concatenate([load_spectrogram_data("$SPEC_DIR", t) for t in track_types], axis=-1)
-    
-    # Encode music theory for each sample
-    theory_data = []
-    for t in track_types:
-        midi_samples = load_midi_data("$MIDI_DIR", t)
-        theory_encodings = np.array([encode_music_theory(sample, t) for sample in midi_samples])
-        theory_data.append(theory_encodings)
-    theory_data = np.concatenate(theory_data, axis=0)
-    
-    if midi_data.size == 0 or spec_data.size == 0 or theory_data.size == 0:
+
+    if packed:
+        dataset, num_samples = make_packed_dataset("$MIDI_DIR", "$SPEC_DIR", track_types, batch_size=batch_size)
+    else:
+        dataset, num_samples = make_training_dataset("$MIDI_DIR", "$SPEC_DIR", track_types,
+                                                     batch_size=batch_size, shuffle_buffer=shuffle_buffer)
+    if num_samples == 0:
         logger.error("No data found. Check preprocessing.")
         return
-    
-    model.fit([midi_data, spec_data, theory_data], midi_data, epochs=20, batch_size=2, verbose=1)
-    model.save("$MODEL_DIR/hybrid_music_generator.h5")
+
+    logger.info(f"Streaming {num_samples} songs for training")
+    model.fit(dataset, epochs=epochs, verbose=1)
+    # Save as a plain functional model so generate.py can load it without the training wrapper
+    models.Model(model.inputs, model.outputs, name=model.name).save("$MODEL_DIR/hybrid_music_generator.h5")
     logger.info("Hybrid model training completed")
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the hybrid music generator")
+    parser.add_argument("--epochs", type=int, default=20, help="Number of training epochs")
+    parser.add_argument("--batch-size", type=int, default=2, help="Batch size")
+    parser.add_argument("--packed", action="store_true", help="Length-bucketed, packed windows instead of fixed 16384-step padding")
+    parser.add_argument("--long-conv", action="store_true", help="Use the FFT Hyena operator instead of SimpleRNN in striped_hyena_layer")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Activation memory budget; enables remat and gradient accumulation as needed")
+    parser.add_argument("--bfloat16", action="store_true", help="Train with the mixed_bfloat16 policy")
+    args = parser.parse_args()
+    train_model(batch_size=args.batch_size, epochs=args.epochs, packed=args.packed, long_conv=args.long_conv,
+                memory_budget_gb=args.memory_budget_gb, bfloat16=args.bfloat16)
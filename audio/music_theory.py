@@ -0,0 +1,102 @@
+import numpy as np
+from midi_events import cached_midi_array, load_midi_events
+
+# Krumhansl-Schmuckler key profiles, tonic at index 0
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+TICKS_PER_BEAT = 480  # Assume 480 ticks/quarter, one chord slot per beat
+MAX_CHORDS = 16
+# Chord types in encoding order: major, minor, diminished, augmented
+TRIAD_INTERVALS = [(0, 4, 7), (0, 3, 7), (0, 3, 6), (0, 4, 8)]
+THEORY_VERSION = "theory-v1"
+
+def _rotations(profile):
+    return np.stack([np.roll(profile, tonic) for tonic in range(12)])
+
+KEY_PROFILES = np.concatenate([_rotations(MAJOR_PROFILE), _rotations(MINOR_PROFILE)])  # (24, 12)
+TRIAD_TEMPLATES = np.zeros((12 * len(TRIAD_INTERVALS), 12), dtype=np.int32)  # row = root * 4 + type
+for _root in range(12):
+    for _type, _intervals in enumerate(TRIAD_INTERVALS):
+        TRIAD_TEMPLATES[_root * 4 + _type, [(_root + i) % 12 for i in _intervals]] = 1
+
+def note_durations(notes, velocities, times):
+    """
+    Duration of each event, measured to the next event on the same pitch
+    (its note_off, or a retrigger). Unterminated notes last one beat.
+    """
+    order = np.lexsort((times, notes))
+    sorted_notes, sorted_times = notes[order], times[order]
+    durations = np.full(len(notes), TICKS_PER_BEAT, dtype=np.int64)
+    same_pitch = sorted_notes[1:] == sorted_notes[:-1]
+    gaps = np.where(same_pitch, sorted_times[1:] - sorted_times[:-1], TICKS_PER_BEAT)
+    durations[order[:-1]] = gaps
+    return durations
+
+def estimate_key(pitch_class_histogram):
+    """
+    Krumhansl-Schmuckler key estimate. Returns (tonic, is_minor, correlation).
+    """
+    h = pitch_class_histogram - pitch_class_histogram.mean()
+    p = KEY_PROFILES - KEY_PROFILES.mean(axis=1, keepdims=True)
+    denom = np.linalg.norm(p, axis=1) * np.linalg.norm(h)
+    correlations = p @ h / np.where(denom == 0, 1, denom)
+    best = int(np.argmax(correlations))
+    return best % 12, best >= 12, float(correlations[best])
+
+def detect_triads(notes, times, weights):
+    """
+    Per-beat triad detection. Returns the template index (root * 4 + type) of
+    every beat whose sounding pitch classes contain a full triad, in order.
+    """
+    beats = (times // TICKS_PER_BEAT).astype(np.int64)
+    beats -= beats.min()
+    chroma = np.zeros((int(beats.max()) + 1, 12))
+    np.add.at(chroma, (beats, notes % 12), weights)
+    present = (chroma > 0).astype(np.int32)
+    complete = present @ TRIAD_TEMPLATES.T == 3  # (n_beats, 48)
+    scores = np.where(complete, chroma @ TRIAD_TEMPLATES.T, -1.0)
+    has_triad = complete.any(axis=1)
+    return np.argmax(scores[has_triad], axis=1)
+
+def encode_music_theory(midi_data, track_type):
+    """
+    64-dim theory encoding of an (n, 3) array of (note, velocity, time) events:
+    12 key tonic one-hot, 4 scale slots (major, minor, key correlation,
+    tonic share of the histogram) and 48 chord slots (12 roots x major, minor,
+    diminished, augmented) for the first 16 triads found.
+    """
+    encoding = np.zeros(64, dtype=np.float32)
+    if track_type == "drums":
+        # Drum note numbers are instruments, not pitches
+        return encoding
+    midi_data = np.asarray(midi_data)
+    notes, velocities, times = (midi_data[:, i].astype(np.int64) for i in range(3))
+    durations = np.maximum(note_durations(notes, velocities, times), 1)
+    sounding = (velocities > 0) & (notes > 0)
+    if not sounding.any():
+        return encoding
+    notes, times, durations = notes[sounding], times[sounding], durations[sounding]
+
+    histogram = np.bincount(notes % 12, weights=durations, minlength=12)
+    tonic, is_minor, correlation = estimate_key(histogram)
+    encoding[tonic] = 1
+    encoding[12 + int(is_minor)] = 1
+    encoding[14] = correlation
+    encoding[15] = histogram[tonic] / histogram.sum()
+
+    triads = detect_triads(notes, times, durations)
+    if len(triads):
+        # Only chord changes count, like the first 16 chords of a chordified stream
+        changes = np.concatenate([[True], triads[1:] != triads[:-1]])
+        encoding[16 + triads[changes][:MAX_CHORDS]] = 1
+    return encoding
+
+def _encode_midi_file(midi_file, track_type):
+    return encode_music_theory(load_midi_events(midi_file, track_type), track_type)
+
+def load_theory_encoding(midi_file, track_type, cache_dir=None):
+    """
+    encode_music_theory over a whole MIDI file, cached per file.
+    """
+    return cached_midi_array(midi_file, track_type, THEORY_VERSION, _encode_midi_file, cache_dir)
@@ -0,0 +1,66 @@
+import random
+
+DEFAULT_BUCKETS = (2048, 4096, 8192, 16384)
+
+def slice_segments(lengths, max_length):
+    """
+    Splits each song into (song_id, offset, length) segments of at most
+    max_length steps, so long songs become several windows instead of being
+    truncated.
+    """
+    segments = []
+    for song_id in sorted(lengths):
+        for offset in range(0, lengths[song_id], max_length):
+            segments.append((song_id, offset, min(max_length, lengths[song_id] - offset)))
+    return segments
+
+def pack_segments(segments, max_length):
+    """
+    First-fit decreasing packing of segments into windows of max_length steps.
+    Returns a list of windows, each a list of segments laid end to end.
+    """
+    windows, free = [], []
+    for segment in sorted(segments, key=lambda s: (-s[2], s[0], s[1])):
+        for i, space in enumerate(free):
+            if segment[2] <= space:
+                windows[i].append(segment)
+                free[i] -= segment[2]
+                break
+        else:
+            windows.append([segment])
+            free.append(max_length - segment[2])
+    return windows
+
+def bucket_length(length, buckets):
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return buckets[-1]
+
+def plan_batches(lengths, batch_size, buckets=DEFAULT_BUCKETS, pack=True, seed=0):
+    """
+    Groups songs into batches of packed windows of equal bucket length.
+
+    lengths maps song_id -> number of steps. Each returned batch is
+    (window_length, [window, ...]) where a window is a list of
+    (song_id, offset, length) segments; windows are padded to window_length
+    and the padding is masked out of the loss.
+    """
+    max_length = buckets[-1]
+    segments = slice_segments(lengths, max_length)
+    windows = pack_segments(segments, max_length) if pack else [[s] for s in segments]
+
+    by_bucket = {}
+    for window in windows:
+        used = sum(segment[2] for segment in window)
+        by_bucket.setdefault(bucket_length(used, buckets), []).append(window)
+
+    rng = random.Random(seed)
+    batches = []
+    for window_length in sorted(by_bucket):
+        bucket_windows = by_bucket[window_length]
+        rng.shuffle(bucket_windows)
+        for i in range(0, len(bucket_windows), batch_size):
+            batches.append((window_length, bucket_windows[i:i + batch_size]))
+    rng.shuffle(batches)
+    return batches
@@ -1,51 +1,167 @@
 import os
 import glob
+import json
+import argparse
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from demucs import separate
-from basic_pitch.inference import predict
+import torch
+from demucs.apply import apply_model
+from demucs.audio import AudioFile
+from demucs.pretrained import get_model
+from basic_pitch import ICASSP_2022_MODEL_PATH
+from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+from basic_pitch.inference import Model, unwrap_output, window_audio_file
+from basic_pitch.note_creation import model_output_to_notes
 import librosa
 import numpy as np
+import soundfile as sf
 from loguru import logger
+from sharding import parse_shard, select_shard, shard_path, merge_shard_files
 
 AUDIO_DIR = "$BASE_DIR/audio"
 MIDI_DIR = "$BASE_DIR/midi"
 SPEC_DIR = "$BASE_DIR/spectrograms"
 NUM_THREADS = 16  # Match M3 Pro’s cores
 LOG_FILE = os.path.join("$LOG_DIR", "preprocess.log")
+MANIFEST_FILE = os.path.join(SPEC_DIR, "manifest.json")
 
 logger.add(LOG_FILE, rotation="500 MB")
 
+# Stem WAVs are only kept for archival, so they are written off the critical path
+ARCHIVE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+_separator = None
+_separator_lock = threading.Lock()
+
+def get_separator():
+    """
+    Loads the htdemucs model once per process; worker threads share it.
+    """
+    global _separator
+    with _separator_lock:
+        if _separator is None:
+            _separator = get_model("htdemucs")
+            _separator.eval()
+        return _separator
+
+def separate_stems(audio_file):
+    """
+    Runs Demucs in memory. Returns ({stem: (channels, samples) array}, sample_rate).
+    """
+    model = get_separator()
+    wav = AudioFile(audio_file).read(streams=0, samplerate=model.samplerate, channels=model.audio_channels)
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    with torch.no_grad():
+        sources = apply_model(model, wav[None], device="cpu", split=True, overlap=0.25)[0]
+    sources = sources * ref.std() + ref.mean()
+    return {name: source.numpy() for name, source in zip(model.sources, sources)}, model.samplerate
+
+_pitch_model = None
+_pitch_model_lock = threading.Lock()
+
+def get_pitch_model():
+    """
+    Loads the basic_pitch model once per process; worker threads share it.
+    """
+    global _pitch_model
+    with _pitch_model_lock:
+        if _pitch_model is None:
+            _pitch_model = Model(ICASSP_2022_MODEL_PATH)
+        return _pitch_model
+
+def predict_array(audio, onset_threshold=0.5, frame_threshold=0.3, minimum_note_length=127.70):
+    """
+    basic_pitch's predict() for a mono float32 array already at
+    AUDIO_SAMPLE_RATE, so stems skip a round trip through a file.
+    Returns (model_output, midi_data, note_events) like predict().
+    """
+    n_overlapping_frames = 30
+    overlap_len = n_overlapping_frames * FFT_HOP
+    audio = np.concatenate([np.zeros(overlap_len // 2, dtype=np.float32), np.asarray(audio, dtype=np.float32)])
+    model = get_pitch_model()
+    output = {"note": [], "onset": [], "contour": []}
+    for window, _ in window_audio_file(audio, AUDIO_N_SAMPLES - overlap_len):
+        for k, v in model.predict(window[None]).items():
+            output[k].append(v)
+    original_length = audio.shape[0] - overlap_len // 2
+    model_output = {k: unwrap_output(np.concatenate(v), original_length, n_overlapping_frames) for k, v in output.items()}
+    min_note_len = int(np.round(minimum_note_length / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))
+    midi_data, note_events = model_output_to_notes(model_output, onset_thresh=onset_threshold,
+                                                   frame_thresh=frame_threshold, min_note_len=min_note_len)
+    return model_output, midi_data, note_events
+
+def archive_stem(stem_file, audio, sr):
+    sf.write(stem_file, audio.T, sr)
+    logger.info(f"Archived stem {stem_file}")
+
 def process_audio(audio_file):
+    song_id = os.path.splitext(os.path.basename(audio_file))[0]
+    entry = {"song_id": song_id, "midi_files": [], "spec_files": []}
     try:
-        # Full source separation
-        stem_dir = os.path.join(MIDI_DIR, "stems", os.path.splitext(os.path.basename(audio_file))[0])
-        spec_stem_dir = os.path.join(SPEC_DIR, os.path.splitext(os.path.basename(audio_file))[0])
+        stem_dir = os.path.join(MIDI_DIR, "stems", song_id)
+        spec_stem_dir = os.path.join(SPEC_DIR, song_id)
         os.makedirs(stem_dir, exist_ok=True)
         os.makedirs(spec_stem_dir, exist_ok=True)
-        separate.main(["-o", stem_dir, audio_file])
-        
+
+        # Full source separation, kept in memory; stems go to disk in the background
+        stems, stem_sr = separate_stems(audio_file)
+
         # Process each stem to MIDI and Mel spectrogram
         for stem in ["vocals", "drums", "bass", "other"]:
+            if stem not in stems:
+                continue
             stem_file = os.path.join(stem_dir, f"{stem}.wav")
-            if os.path.exists(stem_file):
-                # MIDI conversion
-                midi_file = os.path.join(MIDI_DIR, f"{os.path.splitext(os.path.basename(audio_file))[0]}_{stem}.mid")
-                midi_data, _, _ = predict(stem_file)
-                midi_data.write(midi_file)
-                
-                # Mel spectrogram
-                y, sr = librosa.load(stem_file, sr=44100)
-                mel_spec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, hop_length=512)
-                mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-                spec_file = os.path.join(spec_stem_dir, f"{stem}.npy")
-                np.save(spec_file, mel_spec_db)
-                logger.info(f"Processed {stem_file} -> {midi_file} and {spec_file}")
+            ARCHIVE_EXECUTOR.submit(archive_stem, stem_file, stems[stem], stem_sr)
+            y = librosa.to_mono(stems[stem])
+
+            # MIDI conversion
+            midi_file = os.path.join(MIDI_DIR, f"{song_id}_{stem}.mid")
+            y_pitch = librosa.resample(y, orig_sr=stem_sr, target_sr=AUDIO_SAMPLE_RATE)
+            midi_data, _, _ = predict_array(y_pitch)
+            midi_data.write(midi_file)
+
+            # Mel spectrogram
+            sr = 44100
+            if stem_sr != sr:
+                y = librosa.resample(y, orig_sr=stem_sr, target_sr=sr)
+            mel_spec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, hop_length=512)
+            mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+            spec_file = os.path.join(spec_stem_dir, f"{stem}.npy")
+            np.save(spec_file, mel_spec_db)
+            entry["midi_files"].append(midi_file)
+            entry["spec_files"].append(spec_file)
+            logger.info(f"Processed {song_id} {stem} -> {midi_file} and {spec_file}")
+        return entry
     except Exception as e:
         logger.error(f"Failed to process {audio_file}: {e}")
+        return None
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Stem separation, MIDI and spectrogram extraction")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Only process shard i of N (e.g. 0/4)")
+    parser.add_argument("--merge-shards", action="store_true", help="Merge per-shard manifests into manifest.json and exit")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_arguments()
+    if args.merge_shards:
+        manifest = merge_shard_files(MANIFEST_FILE)
+        logger.info(f"Merged shard manifests into {MANIFEST_FILE} ({len(manifest)} songs)")
+        raise SystemExit(0)
+
     audio_files = glob.glob(f"{AUDIO_DIR}/*.wav")
+    manifest_file = MANIFEST_FILE
+    if args.shard is not None:
+        by_id = {os.path.splitext(os.path.basename(f))[0]: f for f in audio_files}
+        owned = select_shard({song_id: os.path.getsize(f) for song_id, f in by_id.items()}, args.shard)
+        audio_files = [by_id[song_id] for song_id in owned]
+        manifest_file = shard_path(MANIFEST_FILE, args.shard)
+        logger.info(f"Shard {args.shard[0]}/{args.shard[1]} owns {len(audio_files)} audio files")
     logger.info(f"Found {len(audio_files)} audio files")
     with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        executor.map(process_audio, audio_files)
-    logger.info("Preprocessing complete.")
+        manifest = [entry for entry in executor.map(process_audio, audio_files) if entry is not None]
+    ARCHIVE_EXECUTOR.shutdown(wait=True)
+    os.makedirs(SPEC_DIR, exist_ok=True)
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=4)
+    logger.info(f"Preprocessing complete. Manifest written to {manifest_file}")
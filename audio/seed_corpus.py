@@ -0,0 +1,90 @@
+import random
+import threading
+from collections import OrderedDict
+from model import find_training_samples, load_song, song_window
+
+TRACK_TYPES = ["vocals", "drums", "bass", "other"]
+
+class SeedCorpus:
+    """
+    Seed material for generation, indexed by song and track.
+
+    The song index is built on first use. Per song, only memory-mapped views
+    of the cached event arrays and spectrograms (plus the small theory
+    vector) are kept in an LRU; dense seq_length windows are cut from them
+    on each request, so cached songs cost address space rather than
+    resident memory and sampling doesn't re-read the corpus.
+    """
+    def __init__(self, midi_dir, spec_dir, track_types=TRACK_TYPES, seq_length=16384, max_cached_songs=32):
+        self.midi_dir = midi_dir
+        self.spec_dir = spec_dir
+        self.track_types = track_types
+        self.seq_length = seq_length
+        self.max_cached_songs = max_cached_songs
+        self._song_ids = None
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def song_ids(self):
+        with self._lock:
+            if self._song_ids is None:
+                self._song_ids = find_training_samples(self.midi_dir, self.spec_dir, self.track_types)
+            return self._song_ids
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def views(self, song_id):
+        """
+        ({track_type: (events, spec)}, theory) for one song, where events and
+        spec are memory-mapped views of the on-disk arrays.
+        """
+        with self._lock:
+            if song_id in self._views:
+                self._views.move_to_end(song_id)
+                return self._views[song_id]
+        views = load_song(song_id, self.midi_dir, self.spec_dir, self.track_types)
+        with self._lock:
+            self._views[song_id] = views
+            if len(self._views) > self.max_cached_songs:
+                self._views.popitem(last=False)
+        return views
+
+    def track(self, song_id, track_type):
+        """
+        The (midi, spec) windows of a single track of a song: (seq_length, 3)
+        and (seq_length, n_mels).
+        """
+        return song_window(self.views(song_id)[0], [track_type], self.seq_length)
+
+    def get(self, song_id):
+        """
+        Returns (midi, spec, theory) for one song: (seq_length, 3 * tracks),
+        (seq_length, n_mels * tracks) and (64,).
+        """
+        tracks, theory = self.views(song_id)
+        return (*song_window(tracks, self.track_types, self.seq_length), theory)
+
+    def sample(self, rng=random):
+        """
+        A random song's (song_id, midi, spec, theory).
+        """
+        song_ids = self.song_ids
+        if not song_ids:
+            raise FileNotFoundError(f"No seed songs found in {self.midi_dir} and {self.spec_dir}")
+        song_id = song_ids[rng.randrange(len(song_ids))]
+        return (song_id, *self.get(song_id))
+
+_default_corpus = None
+_default_lock = threading.Lock()
+
+def get_seed_corpus(midi_dir="$MIDI_DIR", spec_dir="$SPEC_DIR"):
+    """
+    Process-wide corpus shared by every generate_song call.
+    """
+    global _default_corpus
+    with _default_lock:
+        if _default_corpus is None:
+            _default_corpus = SeedCorpus(midi_dir, spec_dir)
+        return _default_corpus
@@ -0,0 +1,89 @@
+import tensorflow as tf
+from tensorflow.keras import layers
+
+class SegmentCausalConv1D(layers.Conv1D):
+    """
+    Causal Conv1D for packed windows. Called on [x, resets], where resets is
+    (batch, steps, 1) and 1 on the first step of every packed segment, a tap
+    that would reach back across a segment start sees zeros instead, exactly
+    like the causal padding at the start of a separate sequence. Kernel and
+    bias match a causal Conv1D, so weights copy straight over.
+    """
+    def __init__(self, filters, kernel_size, **kwargs):
+        kwargs["padding"] = "valid"
+        super().__init__(filters, kernel_size, **kwargs)
+        self.input_spec = None  # Takes [x, resets]
+
+    def build(self, input_shape):
+        super().build(input_shape[0])
+        self.input_spec = None
+
+    def compute_output_shape(self, input_shape):
+        # Conv1D.build passes the shape of x alone
+        x_shape = input_shape[0] if isinstance(input_shape[0], (list, tuple)) else input_shape
+        return tuple(x_shape[:-1]) + (self.filters,)
+
+    def call(self, inputs):
+        x, resets = inputs
+        resets = tf.cast(resets, x.dtype)
+        kernel = tf.cast(self.kernel, x.dtype)
+        k = self.kernel_size[0]
+        # Lag 0 is the current step; kernel[k - 1 - lag] multiplies x[t - lag]
+        y = tf.tensordot(x, kernel[k - 1], axes=1)
+        crossed = tf.zeros_like(resets)
+        for lag in range(1, k):
+            # x[t - lag] belongs to an earlier segment if a segment starts in (t - lag, t]
+            crossed = tf.maximum(crossed, _shift(resets, lag - 1))
+            y += tf.tensordot(_shift(x, lag) * (1 - crossed), kernel[k - 1 - lag], axes=1)
+        if self.use_bias:
+            y += tf.cast(self.bias, x.dtype)
+        return self.activation(y) if self.activation is not None else y
+
+def _shift(x, lag):
+    # x delayed by lag steps along time, zero-filled
+    if lag == 0:
+        return x
+    return tf.pad(x, [[0, 0], [lag, 0], [0, 0]])[:, :-lag]
+
+class SegmentResetCell(layers.Layer):
+    """
+    Wraps an RNN cell for packed windows: the last input channel is the
+    reset flag, and where it is 1 the carried state is zeroed before the
+    step, so every segment starts from the initial state of a separate
+    sequence. The wrapped cell's weights are those of the plain layer.
+    """
+    def __init__(self, cell, **kwargs):
+        super().__init__(**kwargs)
+        self.cell = cell
+        self.state_size = cell.state_size
+        self.output_size = cell.output_size
+
+    def build(self, input_shape):
+        self.cell.build(tuple(input_shape[:-1]) + (input_shape[-1] - 1,))
+        self.built = True
+
+    def call(self, inputs, states, training=False):
+        x, resets = inputs[:, :-1], inputs[:, -1:]
+        states = tf.nest.map_structure(lambda s: s * tf.cast(1 - resets, s.dtype), states)
+        return self.cell(x, states, training=training)
+
+    def get_initial_state(self, batch_size=None):
+        return self.cell.get_initial_state(batch_size)
+
+    def get_config(self):
+        config = super().get_config()
+        config["cell"] = layers.serialize(self.cell)
+        return config
+
+    @classmethod
+    def from_config(cls, config, custom_objects=None):
+        config["cell"] = layers.deserialize(config["cell"], custom_objects=custom_objects)
+        return cls(**config)
+
+def segment_recurrent(cell, x, resets):
+    """
+    layers.RNN over x with cell, restarting from the initial state at every segment start.
+    """
+    return layers.RNN(SegmentResetCell(cell), return_sequences=True)(layers.Concatenate()([x, resets]))
+
+CUSTOM_OBJECTS = {"SegmentCausalConv1D": SegmentCausalConv1D, "SegmentResetCell": SegmentResetCell}
@@ -0,0 +1,91 @@
+import os
+import glob
+import json
+import hashlib
+import argparse
+
+SHARD_FILE_TEMPLATE = "{stem}.shard-{index}-of-{count}{ext}"
+
+def parse_shard(spec):
+    """
+    Parses an "i/N" shard spec into (i, N). Used directly as an argparse type.
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard spec {spec!r}, expected i/N")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard spec {spec!r}, need 0 <= i < N")
+    return index, count
+
+def song_hash(song_id):
+    """
+    Stable 64-bit hash of a song ID. Python's hash() is salted per process,
+    so it cannot be used to agree on an assignment across machines.
+    """
+    return int.from_bytes(hashlib.sha1(song_id.encode("utf-8")).digest()[:8], "big")
+
+def assign_shards(sizes, num_shards):
+    """
+    Deterministically assigns song IDs to shards, balancing total bytes.
+
+    sizes maps song_id -> size in bytes. Songs are placed largest first onto the
+    least loaded shard (ties broken by song hash, then shard index), so every
+    machine that sees the same files computes the same plan.
+    Returns a dict of song_id -> shard index.
+    """
+    loads = [0] * num_shards
+    assignment = {}
+    for song_id in sorted(sizes, key=lambda s: (-sizes[s], song_hash(s), s)):
+        shard = min(range(num_shards), key=lambda i: (loads[i], i))
+        assignment[song_id] = shard
+        loads[shard] += sizes[song_id]
+    return assignment
+
+def select_shard(sizes, shard):
+    """
+    Returns the sorted song IDs owned by shard (an (index, count) tuple).
+    """
+    index, count = shard
+    assignment = assign_shards(sizes, count)
+    return sorted(s for s, i in assignment.items() if i == index)
+
+def shard_path(path, shard):
+    """
+    Per-shard variant of an output path, e.g. catalog.json -> catalog.shard-0-of-4.json.
+    """
+    stem, ext = os.path.splitext(path)
+    index, count = shard
+    return SHARD_FILE_TEMPLATE.format(stem=stem, index=index, count=count, ext=ext)
+
+def merge_shard_files(path, key="song_id"):
+    """
+    Combines every per-shard JSON list written next to path into path itself.
+
+    Entries are de-duplicated on key and sorted so the merged
+    file is identical regardless of which machine finished first. Raises
+    FileNotFoundError if no shard files exist or some shards are missing.
+    Returns the merged list.
+    """
+    stem, ext = os.path.splitext(path)
+    shard_files = sorted(glob.glob(f"{glob.escape(stem)}.shard-*-of-*{ext}"))
+    if not shard_files:
+        raise FileNotFoundError(f"No shard files found for {path}")
+
+    counts = {int(f[:-len(ext)].rsplit("-of-", 1)[1]) for f in shard_files}
+    if len(counts) != 1:
+        raise ValueError(f"Shard files for {path} mix different shard counts: {sorted(counts)}")
+    count = counts.pop()
+    missing = [i for i in range(count) if shard_path(path, (i, count)) not in shard_files]
+    if missing:
+        raise FileNotFoundError(f"Missing shards {missing} of {count} for {path}")
+
+    merged = {}
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            for entry in json.load(f):
+                merged[entry[key]] = entry
+    entries = [merged[k] for k in sorted(merged)]
+    with open(path, "w") as f:
+        json.dump(entries, f, indent=4)
+    return entries
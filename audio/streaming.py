@@ -0,0 +1,71 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+class StreamingConv1D(layers.Conv1D):
+    """
+    Causal Conv1D for chunked inference. Instead of zero-padding every call,
+    it keeps the last kernel_size - 1 input frames of the previous chunk in a
+    buffer, so feeding a sequence chunk by chunk gives the same outputs as
+    feeding it whole. Kernel and bias are identical to a causal Conv1D, so a
+    trained model's weights can be copied straight over.
+    """
+    def __init__(self, filters, kernel_size, batch_size=1, **kwargs):
+        kwargs["padding"] = "valid"
+        super().__init__(filters, kernel_size, **kwargs)
+        self.batch_size = batch_size
+        # Picked up by Model.reset_states()
+        self.stateful = True
+
+    def build(self, input_shape):
+        # Time is padded from the buffer, so build for any chunk length
+        super().build((input_shape[0], None, input_shape[-1]))
+        self.buffer = self.add_weight(name="buffer", shape=(self.batch_size, self.kernel_size[0] - 1, input_shape[-1]),
+                                      initializer="zeros", trainable=False)
+
+    def call(self, inputs):
+        x = tf.concat([tf.cast(self.buffer, inputs.dtype), inputs], axis=1)
+        self.buffer.assign(tf.cast(x[:, -(self.kernel_size[0] - 1):], self.buffer.dtype))
+        return super().call(x)
+
+    def reset_states(self):
+        self.buffer.assign(tf.zeros_like(self.buffer))
+
+def stream_chunks(model, seq, theory, chunk_size=1024):
+    """
+    Runs a stateful model over seq = (midi, spec) chunk by chunk, carrying
+    layer state, and returns the output for the whole sequence. Only the new
+    frames are computed; call model.reset_states() to start a fresh sequence.
+    """
+    midi, spec = seq
+    if not hasattr(model, "_stream_step"):
+        model._stream_step = tf.function(lambda m, s, t: model([m, s, t], training=False))
+    step = lambda m, s: model._stream_step(m, s, theory)
+    outputs = [step(midi[:, i:i + chunk_size], spec[:, i:i + chunk_size]).numpy()
+               for i in range(0, midi.shape[1], chunk_size)]
+    return np.concatenate(outputs, axis=1)
+
+def generate_incremental(model, seed, theory, num_frames, chunk_size=1024, midi_dim=12):
+    """
+    Autoregressive generation with a stateful model. The seed (midi, spec)
+    primes the layer state once, then each output chunk is fed back as the
+    next input chunk, so every new frame is conditioned on all output before
+    it. Returns (batch, num_frames, outputs). Models that predict only MIDI
+    features (outputs == midi_dim) keep the seed spectrogram as conditioning,
+    cycled by position.
+    """
+    midi, spec = seed
+    model.reset_states()
+    last = stream_chunks(model, seed, theory, chunk_size)[:, -chunk_size:]
+    step = lambda m, s: model._stream_step(m, s, theory).numpy()
+    outputs, generated = [], 0
+    while generated < num_frames:
+        if last.shape[-1] > midi_dim:
+            spec_in = last[..., midi_dim:]
+        else:
+            positions = (midi.shape[1] + generated + np.arange(last.shape[1])) % spec.shape[1]
+            spec_in = spec[:, positions]
+        last = step(last[..., :midi_dim], spec_in)
+        outputs.append(last)
+        generated += last.shape[1]
+    return np.concatenate(outputs, axis=1)[:, :num_frames]
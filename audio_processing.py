@@ -30,6 +30,8 @@ from sklearn.cluster import KMeans
 from scipy.signal.windows import hann
 from scipy.stats import pearsonr
 import whisper
+from audio.sharding import parse_shard, select_shard, shard_path, merge_shard_files
+from audio.midi_writer import chords_to_track, write_midi
 
 # ------------------ Krumhansl-Schmuckler Key Profiles ------------------ #
 MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
@@ -44,6 +46,8 @@ def parse_arguments():
     parser.add_argument("--num-workers", type=int, default=4, help="Number of worker processes")
     parser.add_argument("--force", action="store_true", help="Force reprocessing of all files")
     parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR)")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Only process shard i of N (e.g. 0/4); writes catalog.shard-i-of-N.json")
+    parser.add_argument("--merge-shards", action="store_true", help="Merge per-shard catalogs in --root-dir into catalog.json and exit")
     return parser.parse_args()
 
 # Logging Setup (unchanged from the first script)
@@ -652,7 +656,15 @@ def process_song_directory(song_dir, root_dir, vosk_model, logger):
             logger.warning(f"Features extraction returned empty result for {song_dir}")
             features = {}
 
-    
+        # Chord progression as MIDI
+        if features.get('chord_progression'):
+            midi_dir = os.path.join(song_dir_path, "midi")
+            os.makedirs(midi_dir, exist_ok=True)
+            tempo = features.get('tempo') or 120.0
+            chord_midi = os.path.join(midi_dir, f"{song_dir}_ChordProgression.mid")
+            write_midi(chord_midi, [chords_to_track(features['chord_progression'], tempo=tempo)], tempo=tempo)
+            logger.info(f"Wrote chord progression MIDI => {chord_midi}")
+
 
         # Add spectrogram path
         features_with_spectrogram = features.copy()
@@ -691,11 +703,33 @@ def process_song_directory(song_dir, root_dir, vosk_model, logger):
         traceback.print_exc()
         return False, f"Failed to process {song_dir}: {str(e)}"
 
+# ------------------ Sharding ------------------ #
+# Files this script writes into audio/; excluded so shard sizes don't change mid-run
+DERIVED_AUDIO_FILES = {"standardized.wav", "standardized_audio.wav", "vocals.wav", "vocals_converted.wav"}
+
+def source_audio_size(song_dir_path):
+    """
+    Total bytes of a song's source audio, used to balance shards.
+    """
+    audio_dir = Path(song_dir_path) / "audio"
+    return sum(
+        f.stat().st_size for f in audio_dir.iterdir()
+        if f.is_file() and f.name.lower().endswith(('.wav', '.mp3', '.flac', '.ogg', '.aac', '.m4a'))
+        and f.name not in DERIVED_AUDIO_FILES
+    )
+
 # ------------------ Main Function ------------------ #
 def main():
     args = parse_arguments()
     global logger
-    logger = setup_logging()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root_dir)
+    catalog_path = root_dir / "catalog.json"
+    if args.merge_shards:
+        catalog = merge_shard_files(str(catalog_path))
+        logger.info(f"Merged shard catalogs into {catalog_path} ({len(catalog)} songs)")
+        return
 
     print(f"Using device: {device}")
 
@@ -707,7 +741,6 @@ def main():
         logger.warning(f"Failed to load Vosk model: {e}. Will rely on Whisper only.")
         vosk_model = None
 
-    root_dir = Path(args.root_dir)
     song_dirs = [
         d.name for d in root_dir.iterdir()
         if d.is_dir() and (d / "audio").exists() and any(
@@ -719,6 +752,12 @@ def main():
         logger.critical("No valid song directories found!")
         return
 
+    if args.shard is not None:
+        sizes = {d: source_audio_size(root_dir / d) for d in song_dirs}
+        song_dirs = select_shard(sizes, args.shard)
+        catalog_path = Path(shard_path(str(catalog_path), args.shard))
+        logger.info(f"Shard {args.shard[0]}/{args.shard[1]}: {len(song_dirs)} songs, {sum(sizes[d] for d in song_dirs)} bytes")
+
     logger.info(f"Found {len(song_dirs)} song directories to process")
 
     catalog = []
@@ -750,7 +789,7 @@ def main():
                 failed_count += 1
 
     # Write catalog
-    with open(root_dir / "catalog.json", 'w') as f:
+    with open(catalog_path, 'w') as f:
         json.dump(catalog, f, indent=4)
     logger.info(f"Catalog generated with {len(catalog)} songs")
     logger.info(f"Processing complete. Success: {success_count}, Failed: {failed_count}, Total: {len(song_dirs)}")
@@ -0,0 +1,81 @@
+import os
+import time
+import argparse
+import itertools
+import numpy as np
+from audio.benchmarking import peak_rss_mb, run_cases, summarize
+
+def add_group_timers(model, timings):
+    """
+    Times each top-level submodule of model (structure, phrase, EnCodec
+    generators...) with forward hooks. CPU execution is synchronous, so
+    wall-clock time between pre- and post-hook is the module's cost.
+    """
+    starts = {}
+    for name, module in model.named_children():
+        def pre_hook(module, inputs, name=name):
+            starts[name] = time.perf_counter()
+        def post_hook(module, inputs, output, name=name):
+            timings.setdefault(name, []).append((time.perf_counter() - starts[name]) * 1000)
+        module.register_forward_pre_hook(pre_hook)
+        module.register_forward_hook(post_hook)
+
+def run_case(case):
+    """
+    Builds HierarchicalMusicGenerator with random weights and times forward
+    passes. Runs in a fresh process so peak RSS belongs to this case alone.
+    """
+    import torch
+    from model import HierarchicalMusicGenerator, encode_text_prompt
+
+    torch.manual_seed(0)
+    torch.set_num_threads(case["threads"])
+    seq_length, batch_size = case["seq_length"], case["batch_size"]
+    encodec_dim, num_tracks = 60, 4
+    baseline = peak_rss_mb()
+
+    model = HierarchicalMusicGenerator().eval()
+    timings = {}
+    add_group_timers(model, timings)
+    text = torch.tensor(encode_text_prompt("happy pop song in C major"), dtype=torch.float32)
+    text = text.expand(batch_size, *text.shape[1:]).contiguous()
+    phrase_input = torch.randn(batch_size, seq_length, encodec_dim * num_tracks)
+    encodec_input = torch.randn(batch_size, seq_length, encodec_dim * num_tracks)
+
+    latencies = []
+    with torch.inference_mode():
+        for i in range(case["warmup"] + case["repeats"]):
+            if i == case["warmup"]:
+                timings.clear()
+            start = time.perf_counter()
+            model(text, phrase_input, encodec_input)
+            if i >= case["warmup"]:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    result = dict(case)
+    result.update(summarize(latencies, batch_size, seq_length))
+    result.update({
+        "group_latency_ms_median": {name: float(np.median(t)) for name, t in timings.items()},
+        "params": sum(p.numel() for p in model.parameters()),
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    result["peak_rss_delta_mb"] = result["peak_rss_mb"] - baseline
+    return result
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark HierarchicalMusicGenerator forward passes")
+    parser.add_argument("--seq-lengths", type=int, nargs="+", default=[250, 500, 1000], help="EnCodec frame counts to sweep")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4], help="Batch sizes to sweep")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="torch intra-op threads")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before measuring")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per case")
+    parser.add_argument("--output", type=str, default=None, help="Append JSON lines here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cases = ({"model": "HierarchicalMusicGenerator", "mode": "forward", "seq_length": seq_length,
+              "batch_size": batch_size, "threads": args.threads, "warmup": args.warmup,
+              "repeats": args.repeats, "cpu_count": os.cpu_count()}
+             for seq_length, batch_size in itertools.product(args.seq_lengths, args.batch_sizes))
+    run_cases(run_case, cases, args.output)
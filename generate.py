@@ -1,65 +1,354 @@
-import torch
-import numpy as np
 import os
-import librosa
-from loguru import logger
+import sys
+import time
 import argparse
-from model import HierarchicalMusicGenerator, encode_text_prompt #This may require changes with S4 and StripesHyena Gone!
-from lyrics_generator import generate_lyrics
-from speechbrain.pretrained import HIFIGAN
-import soundfile as sf
-from audiocraft.models import EncodecModel
-from audiocraft.utils.notebook import display_AUDIO
-from transformers import AutoTokenizer, AutoModel
-import mido
-from torchaudio.functional import resample
+import threading
+import numpy as np
+from loguru import logger
+from model_registry import get_model_registry
+from prompt_cache import PromptEmbeddingCache
+from lyrics_backend import get_lyrics_service
+
+# torch, audiocraft, transformers and the generator are imported on first use
+# (or by warm_up()), so importing this module - and starting api.py - is fast
 
 LOG_DIR = os.getenv('LOG_DIR')
 LOG_FILE = os.path.join(LOG_DIR, "generate.log")
 logger.add(LOG_FILE, rotation="500 MB")
 
-device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-# VOCODER = HIFIGAN.from_hparams(source="speechbrain/tts-hifigan-ljspeech", savedir="pretrained_models/hifigan")
+ENCODEC_SAMPLE_RATE = 24000
+# Part of the prompt-embedding cache key; bump when the text encoder changes
+TEXT_ENCODER_VERSION = "distilbert-base-uncased"
+_models = {}
+_models_lock = threading.RLock()
+
+def lazy_model(name, build):
+    with _models_lock:
+        if name not in _models:
+            start = time.perf_counter()
+            _models[name] = build()
+            logger.info(f"Loaded {name} in {time.perf_counter() - start:.2f}s")
+        return _models[name]
+
+def get_device():
+    def build():
+        import torch
+        return torch.device("mps" if torch.backends.mps.is_available() else "cpu")
+    return lazy_model("device", build)
+
+def get_encodec_model():
+    def build():
+        from audiocraft.models import EncodecModel
+        encodec_model = EncodecModel.from_pretrain('facebook/encodec_24khz').eval()
+        return encodec_model.to("cpu")  # Load Encoder to CPU because it seems to work better for the system!
+    return lazy_model("encodec", build)
+
+def get_text_encoder():
+    """
+    DistilBERT tokenizer and model for text embedding.
+    """
+    def build():
+        from transformers import AutoTokenizer, AutoModel
+        tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased")
+        return tokenizer, AutoModel.from_pretrained("distilbert-base-uncased").to(get_device()).eval()
+    return lazy_model("text_encoder", build)
+
+def encode_prompt_batch(prompts):
+    # encode_text_prompt embeds one prompt per call; the cache hands it all misses at once
+    from model import encode_text_prompt
+    return [encode_text_prompt(prompt) for prompt in prompts]
+
+def get_prompt_cache():
+    """
+    Prompt embeddings, kept in memory and in $PROMPT_CACHE_DIR when set.
+    """
+    return lazy_model("prompt_cache", lambda: PromptEmbeddingCache(encode_prompt_batch, TEXT_ENCODER_VERSION,
+                                                                   cache_dir=os.getenv('PROMPT_CACHE_DIR')))
+
+def encode_prompts(prompts):
+    return get_prompt_cache().get_many(prompts)
+
+def build_generator():
+    from model import HierarchicalMusicGenerator #This may require changes with S4 and StripesHyena Gone!
+    return HierarchicalMusicGenerator()
+
+# Generator weights are loaded once per process and reloaded only when the checkpoint changes
+get_model_registry().register("music_generator", build_generator,
+                              os.path.join(os.getenv('MODEL_DIR'), "music_generator.pt"), device=get_device)
+
+def get_generator():
+    return get_model_registry().get("music_generator")
+
+def warm_up():
+    """
+    Imports and loads every model generate_song needs. Returns the seconds
+    spent per model so callers can report warm-up apart from start-up.
+    """
+    timings = {}
+    for name, load in [("device", get_device), ("encodec", get_encodec_model), ("text_encoder", get_text_encoder),
+                       ("generator", get_generator)]:
+        start = time.perf_counter()
+        load()
+        timings[name] = time.perf_counter() - start
+    logger.info(f"Warm-up finished in {sum(timings.values()):.2f}s: {timings}")
+    return timings
+
+def decode_stem_batch(encodec_output, num_tracks, encodec_dim, chunk_frames=None, overlap_frames=25):
+    """
+    Decodes every track of every batch entry's EnCodec latents in a single
+    batched decode call and returns (batch, num_tracks, samples) audio at
+    ENCODEC_SAMPLE_RATE. With chunk_frames set, long outputs are decoded in
+    overlapping chunks that are crossfaded back together, which bounds
+    decoder memory.
+    """
+    import torch
+    from audio.render import chunk_bounds, crossfade
+    encodec_model = get_encodec_model()
+    batch, n_frames = encodec_output.shape[:2]
+    # (B, T, tracks * dim) -> (B * tracks, dim, T): one decoder batch entry per stem
+    latents = encodec_output.reshape(batch, n_frames, num_tracks, encodec_dim).permute(0, 2, 3, 1)
+    latents = latents.reshape(batch * num_tracks, encodec_dim, n_frames).to("cpu")
+
+    def decode(frames):
+        # (B * tracks, 1, dim, T): the same layout as a single-stem decode, batched along axis 0
+        with torch.no_grad():
+            return encodec_model.decode(frames.unsqueeze(1)).reshape(batch, num_tracks, -1)
+
+    if not chunk_frames or n_frames <= chunk_frames:
+        return decode(latents)
+    bounds = chunk_bounds(n_frames, chunk_frames, overlap_frames)
+    chunks = [decode(latents[:, :, start:end]).numpy() for start, end in bounds]
+    hop = chunks[0].shape[-1] // (bounds[0][1] - bounds[0][0])
+    return torch.from_numpy(np.stack([[crossfade([c[b, i] for c in chunks], bounds, n_frames * hop, hop)
+                                       for i in range(num_tracks)] for b in range(batch)]))
+
+def decode_stems(encodec_output, num_tracks, encodec_dim, chunk_frames=None, overlap_frames=25):
+    """
+    decode_stem_batch for a single (1, T, tracks * dim) output: (num_tracks, samples).
+    """
+    return decode_stem_batch(encodec_output, num_tracks, encodec_dim, chunk_frames, overlap_frames)[0]
+
+STRUCTURE_LABELS = ["Intro", "Verse1", "Chorus1", "Verse2", "Chorus2", "Bridge", "Outro"]
+WINDOW_FRAMES = 500  # EnCodec frames per model call (5 seconds)
+FRAMES_PER_SECOND = 100
+
+def plan_sections(section_ids, total_frames):
+    """
+    Splits total_frames evenly across the predicted sections, merging
+    consecutive repeats of the same section. Returns (label, start frame) pairs.
+    """
+    section_ids = [int(i) for i in np.ravel(section_ids)] or [0]
+    merged = [i for n, i in enumerate(section_ids) if n == 0 or i != section_ids[n - 1]]
+    starts = np.linspace(0, total_frames, len(merged) + 1).astype(int)[:-1]
+    return [(STRUCTURE_LABELS[i % len(STRUCTURE_LABELS)], int(start)) for i, start in zip(merged, starts)]
+
+def generate_long_latents(model, prompt, plan, total_frames, num_tracks=4, encodec_dim=60,
+                          window_frames=WINDOW_FRAMES, overlap_frames=100, first_output=None):
+    """
+    Sliding-window generation past the model's fixed window. Each window is
+    conditioned on the previous window's last overlap_frames outputs (placed
+    at the start of its phrase and EnCodec inputs) and on the prompt plus the
+    label of the section it starts in. Overlapping latent frames are
+    crossfaded, and finished (frames, tracks * dim) segments are yielded as
+    soon as each window is done, so memory stays constant in song length.
+    first_output reuses an already computed (phrase, EnCodec) first window.
+    """
+    import torch
+    device = get_device()
+    labels = [label for label, _ in plan]
+    embeddings = dict(zip(labels, encode_prompts([f"{prompt}, {label.lower()}" for label in labels])))
+    fade = np.linspace(0, 1, overlap_frames, endpoint=False)[:, None]
+    width = encodec_dim * num_tracks
+    tail, pending, emitted = None, None, 0
+    while emitted < total_frames:
+        label = [label for label, start in plan if start <= emitted][-1]
+        text_tensor = torch.tensor(embeddings[label], dtype=torch.float32).to(device)
+        phrase_input = torch.zeros((1, window_frames, width), dtype=torch.float32).to(device)
+        encodec_input = torch.zeros((1, window_frames, width), dtype=torch.float32).to(device)
+        if tail is None and first_output is not None:
+            phrase_output, encodec_output = first_output
+        else:
+            if tail is not None:
+                phrase_input[:, :overlap_frames], encodec_input[:, :overlap_frames] = tail
+            with torch.no_grad():
+                _, phrase_output, encodec_output = model(text_tensor, phrase_input, encodec_input)
+        tail = (phrase_output[:, -overlap_frames:], encodec_output[:, -overlap_frames:])
+
+        latents = encodec_output[0].cpu().numpy()
+        if pending is not None:
+            latents[:overlap_frames] = pending * (1 - fade) + latents[:overlap_frames] * fade
+        # This window covers frames [emitted, emitted + window_frames); its tail
+        # is held back to be crossfaded with the next window unless it's the last
+        if emitted + window_frames >= total_frames:
+            segment = latents[:total_frames - emitted]
+        else:
+            segment, pending = latents[:window_frames - overlap_frames], latents[window_frames - overlap_frames:]
+        emitted += len(segment)
+        yield label, segment
+
+def decode_segments(segments, num_tracks, encodec_dim, context_frames=25):
+    """
+    Decodes and mixes each latent segment as it arrives, yielding (label,
+    16 kHz audio). Every segment is decoded together with the last
+    context_frames latent frames before it, whose audio is then dropped, and
+    the stems go through one StreamingMixer, so joins carry no decoder or
+    resampler edge effects.
+    """
+    import torch
+    from audio.mixing import StreamingMixer
+    mixer = StreamingMixer(orig_sr=ENCODEC_SAMPLE_RATE, target_sr=16000)
+    context = np.zeros((0, num_tracks * encodec_dim), dtype=np.float32)
+    label = None
+    for label, segment in segments:
+        latents = np.concatenate([context, segment])
+        stems = decode_stems(torch.from_numpy(latents[None]).float(), num_tracks, encodec_dim).cpu().numpy()
+        context = segment[-context_frames:]
+        yield label, mixer.push(stems[:, int(round(stems.shape[1] * (len(latents) - len(segment)) / len(latents))):])
+    yield label, mixer.flush()
+
+def write_audio_stream(chunks, output_file):
+    """
+    Appends (label, audio) chunks to a 16 kHz WAV as they arrive.
+    """
+    import soundfile as sf
+    with sf.SoundFile(output_file, "w", samplerate=16000, channels=1) as out:
+        for label, audio in chunks:
+            out.write(audio)
+            logger.info(f"Wrote {len(audio) / 16000:.1f}s of {label} to {output_file}")
+    return output_file
+
+def first_window(prompt, num_tracks=4, encodec_dim=60, sequence_length=WINDOW_FRAMES):
+    """
+    Runs the generator once on the prompt from empty inputs. Returns the
+    model and its (structure, phrase, EnCodec) outputs.
+    """
+    import torch
+    device = get_device()
+    model = get_generator()
+    text_tensor = torch.tensor(get_prompt_cache().get(prompt), dtype=torch.float32).to(device)
+    phrase_input = torch.zeros((1, sequence_length, encodec_dim * num_tracks), dtype=torch.float32).to(device)
+    encodec_input = torch.zeros((1, sequence_length, encodec_dim * num_tracks), dtype=torch.float32).to(device)
+    with torch.no_grad():
+        return (model, *model(text_tensor, phrase_input, encodec_input))
+
+def stream_song(prompt, duration=None, num_tracks=4, encodec_dim=60, seed=None):
+    """
+    Generator API: yields (section label, mixed 16 kHz audio) chunks as soon
+    as each window is generated and decoded, instead of after the whole song.
+    Lyrics aren't part of the audio path, so they're left to the caller.
+    """
+    import torch
+    if seed is not None:
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+    model, structure, phrase_output, encodec_output = first_window(prompt, num_tracks, encodec_dim)
+    sections = torch.argmax(structure, dim=-1).cpu().numpy().tolist()
+    total_frames = max(int((duration or WINDOW_FRAMES / FRAMES_PER_SECOND) * FRAMES_PER_SECOND), 1)
+    plan = plan_sections(sections, total_frames)
+    segments = generate_long_latents(model, prompt, plan, total_frames, num_tracks, encodec_dim,
+                                     first_output=(phrase_output, encodec_output))
+    yield from decode_segments(segments, num_tracks, encodec_dim)
 
-# Initialize EnCodec model
-encodec_model = EncodecModel.from_pretrain('facebook/encodec_24khz').to(device)
-encodec_model.eval()
-encodec_model.to("cpu")  # Load Encoder to CPU because it seems to work better for the system!
+def generate_batch(requests, num_tracks=4, encodec_dim=60):
+    """
+    Single-window generate_song for several requests at once: one batched
+    generator forward pass and one batched EnCodec decode, then each song is
+    mixed and written to its own output_file. Returns one (output_file, error)
+    pair per request, so one bad request doesn't fail the others. All
+    requests share the first request's seed.
+    """
+    import torch
+    import soundfile as sf
+    from audio.mixing import mix
+    seed = requests[0].get("seed")
+    if seed is not None:
+        torch.manual_seed(seed)
+        np.random.seed(seed)
 
-# Load tokenizer for text embedding
-tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased")
-text_model = AutoModel.from_pretrained("distilbert-base-uncased").to(device)
+    lyrics_service = get_lyrics_service()
+    lyrics_futures = [None if r.get("lyrics") else lyrics_service.submit(
+        f"Write a {r.get('style', 'pop')} song in {r.get('key', 'C')} {r.get('mode', 'major')} about {r['prompt']}")
+        for r in requests]
 
-def generate_song(prompt, lyrics=None, output_file=os.path.join(os.getenv('OUTPUT_DIR'), "generated_song.wav"), tempo=120, key="C", mode="major", style="pop"):
+    device = get_device()
+    model = get_generator()
+    embeddings = [torch.tensor(e, dtype=torch.float32) for e in encode_prompts([r["prompt"] for r in requests])]
+    if len({tuple(e.shape) for e in embeddings}) > 1:
+        # Embeddings that can't be stacked (e.g. different token lengths) run one by one
+        return [pair for r in requests for pair in generate_batch([r], num_tracks, encodec_dim)]
+    text_tensor = torch.cat(embeddings, dim=0).to(device)
+    batch = len(requests)
+    phrase_input = torch.zeros((batch, WINDOW_FRAMES, encodec_dim * num_tracks), dtype=torch.float32).to(device)
+    encodec_input = torch.zeros((batch, WINDOW_FRAMES, encodec_dim * num_tracks), dtype=torch.float32).to(device)
+    with torch.no_grad():
+        structure, phrase_output, encodec_output = model(text_tensor, phrase_input, encodec_input)
+    stems = decode_stem_batch(encodec_output, num_tracks, encodec_dim).cpu().numpy()
+    logger.info(f"Generated a batch of {batch} songs")
+
+    results = []
+    for request, song_stems in zip(requests, stems):
+        try:
+            output_file = request.get("output_file") or os.path.join(os.getenv('OUTPUT_DIR'), "generated_song.wav")
+            sf.write(output_file, mix(song_stems, orig_sr=ENCODEC_SAMPLE_RATE, target_sr=16000), 16000)
+            results.append((output_file, None))
+        except Exception as e:
+            logger.error(f"Error writing batched song: {e}")
+            results.append((None, str(e)))
+    for lyrics_future in lyrics_futures:
+        if lyrics_future is not None and not lyrics_service.result(lyrics_future):
+            logger.error("Failed to generate lyrics")
+    return results
+
+def generate_song(prompt, lyrics=None, output_file=os.path.join(os.getenv('OUTPUT_DIR'), "generated_song.wav"), tempo=120, key="C", mode="major", style="pop",
+                  decode_chunk_frames=None, duration=None, seed=None):
+    """
+    duration (seconds) longer than one model window switches to sliding-window
+    long-form generation, written to output_file window by window. seed makes
+    the run reproducible.
+    """
     try:
-        model = HierarchicalMusicGenerator().to(device) #This will likely require big changes based on your implementations
-        model.load_state_dict(torch.load(os.path.join(os.getenv('MODEL_DIR'), "music_generator.pt")))
-        model.eval()
+        import torch
+        import soundfile as sf
+        from audio.mixing import mix
+        if seed is not None:
+            torch.manual_seed(seed)
+            np.random.seed(seed)
 
-        # Encode text prompt
-        text_data = encode_text_prompt(prompt)
-        text_tensor = torch.tensor(text_data, dtype=torch.float32).to(device)
+        # Lyrics only matter for the per-section split, so they're generated while the audio is
+        lyrics_service = get_lyrics_service()
+        lyrics_future = None
+        if lyrics is None:
+            lyrics_future = lyrics_service.submit(f"Write a {style} song in {key} {mode} about {prompt}")
 
-        # Initialize input tensors
+        # Encode text prompt and run the first window
         num_tracks = 4  # Vocals, drums, bass, other
-        sequence_length = 500  # EnCodec sequence length (5 seconds)
+        sequence_length = WINDOW_FRAMES  # EnCodec sequence length (5 seconds)
         encodec_dim = 60  # EnCodec dimension
-        phrase_input = torch.zeros((1, sequence_length, encodec_dim * num_tracks), dtype=torch.float32).to(device)
-        encodec_input = torch.zeros((1, sequence_length, encodec_dim * num_tracks), dtype=torch.float32).to(device)
+        model, structure, phrase_output, encodec_output = first_window(prompt, num_tracks, encodec_dim, sequence_length)
 
-        with torch.no_grad():
-            structure, phrase_output, encodec_output = model(text_tensor, phrase_input, encodec_input)
-
-        structure_labels = ["Intro", "Verse1", "Chorus1", "Verse2", "Chorus2", "Bridge", "Outro"]
         sections = torch.argmax(structure, dim=-1).cpu().numpy().tolist()
 
-        # Generate lyrics if not provided
-        if lyrics is None:
-            lyrics_prompt = f"Write a {style} song in {key} {mode} about {prompt}"
-            lyrics = generate_lyrics(lyrics_prompt)
+        tracks = ["vocals", "drums", "bass", "other"]
+
+        if duration and duration * FRAMES_PER_SECOND > sequence_length:
+            total_frames = int(duration * FRAMES_PER_SECOND)
+            plan = plan_sections(sections, total_frames)
+            logger.info(f"Long-form generation of {duration}s across sections {plan}")
+            segments = generate_long_latents(model, prompt, plan, total_frames, num_tracks, encodec_dim,
+                                             first_output=(phrase_output, encodec_output))
+            write_audio_stream(decode_segments(segments, num_tracks, encodec_dim), output_file)
+        else:
+            # Decode all stems in one batched call, then mix and resample once
+            stems = decode_stems(encodec_output, len(tracks), encodec_dim, chunk_frames=decode_chunk_frames)
+            mixed_AUDIO = mix(stems.cpu().numpy(), orig_sr=ENCODEC_SAMPLE_RATE, target_sr=16000)
+            sf.write(output_file, mixed_AUDIO, 16000)  # Important: write at 16kHz
+        logger.info(f"Generated full song saved to {output_file}")
+
+        if lyrics_future is not None:
+            lyrics = lyrics_service.result(lyrics_future)
             if not lyrics:
                 logger.error("Failed to generate lyrics")
-                return
+                return output_file
             logger.info(f"Generated lyrics:\n{lyrics}")
         else:
             logger.info("Using provided lyrics.")
@@ -67,40 +356,12 @@ def generate_song(prompt, lyrics=None, output_file=os.path.join(os.getenv('OUTPU
         lyrics_lines = lyrics.split("\n")
         lyrics_per_section = len(lyrics_lines) // len(sections) if sections else len(lyrics_lines)
         section_lyrics = [lyrics_lines[i:i + lyrics_per_section] for i in range(0, len(lyrics_lines), lyrics_per_section)]
-
-        tracks = ["vocals", "drums", "bass", "other"]
-
-        # Generate Encodec output
-        generated_AUDIO = {}
-        for idx, track in enumerate(tracks):
-            track_encodec_output = encodec_output[:, :, idx*encodec_dim:(idx+1)*encodec_dim]
-            # Convert output to proper format for EnCodec decoding
-            track_encodec_output = track_encodec_output.permute(0, 2, 1)  # Swap dimensions
-            track_encodec_output = track_encodec_output.unsqueeze(0)
-
-            with torch.no_grad():
-                track_encodec_output = track_encodec_output.to("cpu")  # Move to CPU for running
-                decoded_AUDIO = encodec_model.decode(track_encodec_output)
-
-            # Resample to 16kHz for output
-            decoded_AUDIO_resampled = resample(decoded_AUDIO, 24000, 16000)
-
-            # Store the generated audio for each track
-            generated_AUDIO[track] = decoded_AUDIO_resampled.cpu().numpy().squeeze()
-
-        # Mixing and output
-        mixed_AUDIO = (
-            generated_AUDIO["vocals"] * 0.4 +
-            generated_AUDIO["drums"] * 0.2 +
-            generated_AUDIO["bass"] * 0.2 +
-            generated_AUDIO["other"] * 0.2
-        )
-        sf.write(output_file, mixed_AUDIO, 16000)  # Important: write at 16kHz
-        logger.info(f"Generated full song saved to {output_file}")
+        return output_file
 
     except Exception as e:
+        # Raised rather than exit(1) so a failed generation can't take down the process running it
         logger.error(f"Error during generation: {e}", exc_info=True)
-        exit(1)
+        raise
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate a song with a text prompt")
@@ -110,5 +371,12 @@ if __name__ == "__main__":
     parser.add_argument("--key", type=str, default="C", help="Key of the song")
     parser.add_argument("--mode", type=str, default="major", help="Mode of the song")
     parser.add_argument("--style", type=str, default="pop", help="Style of the song")
+    parser.add_argument("--decode-chunk-frames", type=int, default=None, help="Decode EnCodec output in overlapping chunks of this many frames")
+    parser.add_argument("--duration", type=float, default=None, help="Song length in seconds; longer than 5s uses sliding-window generation")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible output")
     args = parser.parse_args()
-    generate_song(prompt=args.prompt, lyrics=args.lyrics, tempo=args.tempo, key=args.key, mode=args.mode, style=args.style)
+    try:
+        generate_song(prompt=args.prompt, lyrics=args.lyrics, tempo=args.tempo, key=args.key, mode=args.mode, style=args.style,
+                      decode_chunk_frames=args.decode_chunk_frames, duration=args.duration, seed=args.seed)
+    except Exception:
+        sys.exit(1)
@@ -0,0 +1,271 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+
+class QueueFull(Exception):
+    pass
+
+def _warm_worker():
+    # Each worker process loads the models once, before taking any job
+    from generate import warm_up
+    warm_up()
+
+def _run_task(task_id, started, fn, *args):
+    # Reports the start right away so the API can show the job as running,
+    # and returns the start time with the result in case that report is late
+    start = time.time()
+    started.put((task_id, start))
+    return start, fn(*args)
+
+def _run_generation(params):
+    from generate import generate_song
+    return generate_song(**params)
+
+def _run_batch(params_list):
+    from generate import generate_batch
+    return generate_batch(params_list)
+
+def _run_stream(params, chunks):
+    """
+    Streams a song into the chunks queue as 16-bit PCM bytes while writing it
+    to params["output_file"]; None marks the end of the stream.
+    """
+    import numpy as np
+    from generate import stream_song, write_audio_stream
+
+    def forward(audio_chunks):
+        for label, audio in audio_chunks:
+            chunks.put((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+            yield label, audio
+    try:
+        audio_chunks = stream_song(params["prompt"], duration=params.get("duration"), seed=params.get("seed"))
+        return write_audio_stream(forward(audio_chunks), params["output_file"])
+    finally:
+        chunks.put(None)
+
+class JobQueue:
+    """
+    Song generation jobs run in a bounded pool of worker processes, so the
+    API process never blocks on (or crashes with) a generation. At most
+    max_pending jobs may be queued or running; submit() raises QueueFull
+    beyond that. A pool broken by a dying worker is replaced.
+
+    With a ResultCache, jobs submitted with a cache key are answered from it
+    when the song already exists, and concurrent submissions of the same key
+    share one job (single flight) instead of generating it again.
+
+    Single-window jobs are micro-batched: jobs with the same seed arriving
+    within batch_window seconds, up to max_batch of them, run as one
+    generate_batch call in a single worker.
+    """
+    def __init__(self, workers=1, max_pending=8, max_finished=1024, cache=None, batch_window=0.05, max_batch=4):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.cache = cache
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._jobs = {}
+        self._inflight = {}
+        self._batches = {}
+        self._tasks = {}
+        self._started = None
+        self._lock = threading.RLock()  # done-callbacks of finished futures run inline
+        self._executor = None
+        self._manager = None
+        self.warm_futures = []
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_warm_worker)
+        return self._executor
+
+    def _get_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    def _started_queue(self):
+        # Workers report task starts on a Manager queue; a thread marks those jobs running
+        if self._started is None:
+            self._started = self._get_manager().Queue()
+            threading.Thread(target=self._watch_starts, args=(self._started,), name="job-starts", daemon=True).start()
+        return self._started
+
+    def _watch_starts(self, started):
+        while True:
+            try:
+                message = started.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            task_id, start = message
+            with self._lock:
+                for job in self._tasks.get(task_id, []):
+                    self._mark_started(job, start)
+
+    def _mark_started(self, job, start):
+        if job["started"] is None:
+            job["started"] = start
+        if job["status"] == "queued":
+            job["status"] = "running"
+
+    def start(self):
+        """
+        Spawns and warms every worker in the background; warm_futures finish
+        once they are ready.
+        """
+        with self._lock:
+            pool = self._pool()
+            self._started_queue()
+            self.warm_futures = [pool.submit(os.getpid) for _ in range(self.workers)]
+
+    def pending(self):
+        with self._lock:
+            return sum(job["status"] in ("queued", "running") for job in self._jobs.values())
+
+    def _new_job(self, owner, params, key):
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "owners": {owner}, "params": params, "key": key, "status": "queued", "result": None,
+               "error": None, "created": time.time(), "started": None, "finished": None, "done": Future(),
+               "task": None}
+        self._jobs[job_id] = job
+        return job
+
+    def submit(self, owner, params, key=None, stream=False):
+        """
+        Returns the job ID. With stream=True, a job that has to generate runs
+        through stream_song and gets a "chunks" queue of PCM bytes (None at
+        the end) for the caller to relay; cached or shared jobs have none.
+        """
+        with self._lock:
+            if key is not None and self.cache is not None:
+                cached = self.cache.lookup(key)
+                if cached:
+                    job = self._new_job(owner, params, key)
+                    job.update(status="done", result=cached, finished=time.time())
+                    job["done"].set_result(cached)
+                    logger.info(f"Job {job['id']} for {owner} served from cache")
+                    self._prune()  # Cache hits finish here, never reaching _complete
+                    return job["id"]
+                if key in self._inflight:
+                    job = self._inflight[key]
+                    job["owners"].add(owner)
+                    logger.info(f"Job {job['id']} shared with {owner}")
+                    return job["id"]
+                params = dict(params, output_file=self.cache.temp_path(key))
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} generations already pending")
+            job = self._new_job(owner, params, key)
+            job["chunks"] = None
+            if key is not None and self.cache is not None:
+                self._inflight[key] = job
+            if stream:
+                job["chunks"] = self._get_manager().Queue()
+                self._dispatch([job], _run_stream, params, job["chunks"])
+            elif self.max_batch > 1 and not params.get("duration") and not params.get("decode_chunk_frames"):
+                self._add_to_batch(job)
+            else:
+                self._dispatch([job], _run_generation, params)
+        logger.info(f"Queued job {job['id']} for {owner}")
+        return job["id"]
+
+    def _add_to_batch(self, job):
+        seed = job["params"].get("seed")
+        batch = self._batches.setdefault(seed, [])
+        batch.append(job)
+        if len(batch) >= self.max_batch:
+            self._flush_batch(seed, batch, locked=True)
+        elif len(batch) == 1:
+            timer = threading.Timer(self.batch_window, self._flush_batch, args=(seed, batch))
+            timer.daemon = True
+            timer.start()
+
+    def _flush_batch(self, seed, batch, locked=False):
+        if not locked:
+            with self._lock:
+                return self._flush_batch(seed, batch, locked=True)
+        if self._batches.get(seed) is not batch:
+            return  # Already flushed on reaching max_batch
+        del self._batches[seed]
+        if len(batch) == 1:
+            self._dispatch(batch, _run_generation, batch[0]["params"])
+        elif batch:
+            logger.info(f"Dispatching a batch of {len(batch)} jobs")
+            self._dispatch(batch, _run_batch, [job["params"] for job in batch])
+
+    def _dispatch(self, jobs, fn, *args):
+        # Called with self._lock held
+        task_id = uuid.uuid4().hex
+        self._tasks[task_id] = jobs
+        try:
+            task = self._pool().submit(_run_task, task_id, self._started_queue(), fn, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            task = self._pool().submit(_run_task, task_id, self._started_queue(), fn, *args)
+        for job in jobs:
+            job["task"] = task
+        task.add_done_callback(lambda task: self._finish(task_id, jobs, task, batched=fn is _run_batch))
+
+    def _finish(self, task_id, jobs, task, batched=False):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+        try:
+            start, output = task.result()
+            with self._lock:
+                for job in jobs:
+                    self._mark_started(job, start)
+            results = output if batched else [(output, None)]
+        except BrokenProcessPool as e:
+            results = [(None, f"Worker process died: {e}")] * len(jobs)
+            with self._lock:
+                self._executor = None
+        except Exception as e:
+            results = [(None, str(e))] * len(jobs)
+        for job, (result, error) in zip(jobs, results):
+            self._complete(job, result, error)
+
+    def _complete(self, job, result, error):
+        if error is None and job["key"] is not None and self.cache is not None:
+            try:
+                result = self.cache.commit(job["key"], result)
+            except Exception as e:
+                error = str(e)
+        if error is not None and job["key"] is not None and self.cache is not None:
+            # A partial temp file is never published, so nothing else would remove it
+            self.cache.discard(job["params"]["output_file"])
+        with self._lock:
+            job["finished"] = time.time()
+            if error is None:
+                job["status"], job["result"] = "done", result
+            else:
+                job["status"], job["error"] = "failed", error
+            self._inflight.pop(job["key"], None)
+        job["done"].set_result(job["result"])
+        logger.info(f"Job {job['id']} {job['status']}" + (f": {job['error']}" if job["error"] else ""))
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = sorted((j for j in self._jobs.values() if j["status"] in ("done", "failed")),
+                              key=lambda j: j["finished"])
+            for job in finished[:max(len(finished) - self.max_finished, 0)]:
+                del self._jobs[job["id"]]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._started is not None:
+            self._started.put(None)
+        if self._manager is not None:
+            self._manager.shutdown()
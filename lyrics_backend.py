@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from loguru import logger
+from prompt_cache import normalize_prompt
+
+class ExternalLyricsBackend:
+    """
+    The LLM-backed lyrics_generator.generate_lyrics, imported on first use.
+    """
+    name = "external"
+
+    def generate(self, prompt):
+        from lyrics_generator import generate_lyrics
+        return generate_lyrics(prompt)
+
+class StubLyricsBackend:
+    """
+    Offline stand-in: deterministic placeholder lyrics built from the prompt.
+    """
+    name = "stub"
+
+    def generate(self, prompt):
+        words = normalize_prompt(prompt).split() or ["la"]
+        return "\n".join(" ".join(words[i:] + words[:i]) for i in range(8))
+
+LYRICS_BACKENDS = {"external": ExternalLyricsBackend, "stub": StubLyricsBackend}
+
+class LyricsService:
+    """
+    Runs lyrics generation in a background thread so it overlaps with audio
+    generation. Results are cached per normalized prompt and backend; a
+    request for a prompt already in flight shares its future. Failed or
+    empty results aren't cached.
+    """
+    def __init__(self, backend, timeout=60.0, max_entries=128, workers=2):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lyrics")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _generate(self, key, prompt):
+        try:
+            lyrics = self.backend.generate(prompt)
+        except Exception:
+            self._forget(key)
+            raise
+        if not lyrics:
+            self._forget(key)
+        return lyrics
+
+    def _forget(self, key):
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def submit(self, prompt):
+        key = (self.backend.name, normalize_prompt(prompt))
+        with self._lock:
+            if key in self._futures:
+                self._futures.move_to_end(key)
+                return self._futures[key]
+            future = self._executor.submit(self._generate, key, prompt)
+            self._futures[key] = future
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+            return future
+
+    def result(self, future):
+        """
+        Lyrics for a submitted prompt, or None if the backend failed or
+        didn't answer within the timeout.
+        """
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            logger.error(f"Lyrics generation timed out after {self.timeout}s")
+        except Exception as e:
+            logger.error(f"Lyrics generation failed: {e}")
+        return None
+
+_default_service = None
+_default_lock = threading.Lock()
+
+def get_lyrics_service():
+    """
+    Process-wide service; $LYRICS_BACKEND picks the backend (external or
+    stub) and $LYRICS_TIMEOUT the timeout in seconds.
+    """
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            backend = LYRICS_BACKENDS[os.getenv("LYRICS_BACKEND", "external")]()
+            _default_service = LyricsService(backend, timeout=float(os.getenv("LYRICS_TIMEOUT", "60")))
+        return _default_service
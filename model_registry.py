@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+from loguru import logger
+
+def load_state_dict(checkpoint_path):
+    """
+    Reads a checkpoint memory-mapped where torch supports it (2.1+), so the
+    tensors are paged in from the file rather than unpickled into buffers.
+    The result is a view of the file: copy it into the model rather than
+    assigning it, or an in-place rewrite of the file changes (or, if
+    truncated, crashes) the live weights.
+    """
+    import torch
+    try:
+        return torch.load(checkpoint_path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:
+        return torch.load(checkpoint_path, map_location="cpu")
+
+class ModelRegistry:
+    """
+    Loads each registered model once per process and hands out the same
+    eval-mode instance on every get(). The checkpoint is re-checked at most
+    every check_interval seconds; if it changed on disk the model is rebuilt
+    and swapped in, and callers already holding the old instance keep it.
+    Writing the new checkpoint to a temp file and renaming it into place
+    avoids reloading a half-written file.
+    """
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, checkpoint_path, device="cpu"):
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = {"factory": factory, "checkpoint": checkpoint_path, "device": device,
+                                       "model": None, "stamp": None, "checked": 0.0,
+                                       "load_lock": threading.Lock()}
+
+    def _stamp(self, path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, entry):
+        start = time.perf_counter()
+        stamp = self._stamp(entry["checkpoint"])
+        model = entry["factory"]()
+        # Copied into the model's own parameters, so the weights in service never
+        # alias the checkpoint file that hot reload watches
+        state_dict = load_state_dict(entry["checkpoint"])
+        model.load_state_dict(state_dict)
+        del state_dict
+        # device may be a callable so it can be resolved lazily, at first load
+        device = entry["device"]() if callable(entry["device"]) else entry["device"]
+        model = model.to(device).eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+        entry["model"], entry["stamp"] = model, stamp
+        logger.info(f"Loaded {entry['checkpoint']} in {time.perf_counter() - start:.2f}s")
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries[name]
+        if entry["model"] is not None and time.monotonic() - entry["checked"] < self.check_interval:
+            return entry["model"]
+        with entry["load_lock"]:
+            entry["checked"] = time.monotonic()
+            if entry["model"] is None:
+                self._load(entry)
+                return entry["model"]
+            try:
+                if self._stamp(entry["checkpoint"]) != entry["stamp"]:
+                    logger.info(f"{entry['checkpoint']} changed on disk, reloading {name}")
+                    self._load(entry)
+            except Exception as e:
+                # Keep serving the previous weights if the new file is missing (mid-rename), mid-write or broken
+                logger.error(f"Reloading {name} failed, keeping the loaded model: {e}")
+            return entry["model"]
+
+    def reload(self, name):
+        with self._lock:
+            entry = self._entries[name]
+        with entry["load_lock"]:
+            self._load(entry)
+            return entry["model"]
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+def get_model_registry():
+    """
+    Process-wide registry shared by the CLI and the API.
+    """
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        return _default_registry
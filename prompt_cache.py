@@ -0,0 +1,81 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from loguru import logger
+
+def normalize_prompt(prompt):
+    """
+    Case- and whitespace-insensitive form of a prompt, used as the cache key.
+    """
+    return " ".join(prompt.lower().split())
+
+class PromptEmbeddingCache:
+    """
+    Text-prompt embeddings keyed by normalized prompt and encoder version.
+
+    Hits come from an in-memory LRU, then from cache_dir (one .npy per
+    prompt) when set. All misses of a get_many() call are encoded together in
+    a single encode_batch(prompts) call, which returns one array per prompt.
+    """
+    def __init__(self, encode_batch, version, max_entries=256, cache_dir=None):
+        self.encode_batch = encode_batch
+        self.version = version
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, prompt):
+        return hashlib.sha1(f"{self.version}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.cache_dir and os.path.exists(self._disk_path(key)):
+            try:
+                embedding = np.load(self._disk_path(key))
+            except (OSError, ValueError):
+                return None
+            self._store(key, embedding, persist=False)
+            return embedding
+        return None
+
+    def _store(self, key, embedding, persist=True):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist and self.cache_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+
+    def get_many(self, prompts):
+        keys = [self.key(p) for p in prompts]
+        found = {k: self._lookup(k) for k in set(keys)}
+        missing = OrderedDict((k, p) for k, p in zip(keys, prompts) if found[k] is None)
+        self.hits += len(keys) - sum(found[k] is None for k in keys)
+        self.misses += len(missing)
+        if missing:
+            logger.info(f"Encoding {len(missing)} uncached prompt(s)")
+            for k, embedding in zip(missing, self.encode_batch(list(missing.values()))):
+                found[k] = np.asarray(embedding)
+                self._store(k, found[k])
+        return [found[k] for k in keys]
+
+    def get(self, prompt):
+        return self.get_many([prompt])[0]
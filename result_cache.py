@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from loguru import logger
+from prompt_cache import normalize_prompt
+
+class ResultCache:
+    """
+    Generated songs on disk, named by a hash of everything that determines
+    them: request parameters, seed and model version. Least recently used
+    files are evicted once the directory grows past max_bytes, and temp files
+    left behind by crashed writers once untouched for stale_temp_seconds.
+    """
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, stale_temp_seconds=3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stale_temp_seconds = stale_temp_seconds
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, params, seed, model_version):
+        params = dict(params, prompt=normalize_prompt(params.get("prompt", "")))
+        payload = json.dumps({"params": params, "seed": seed, "model": model_version}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def temp_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex[:8]}.tmp.wav")
+
+    def lookup(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            return None
+        return path
+
+    def commit(self, key, temp_path):
+        """
+        Publishes a finished temp file under its key and evicts old entries.
+        """
+        path = self.path(key)
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+
+    def discard(self, temp_path):
+        """
+        Removes the temp file of a generation that failed, if it got that far.
+        """
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".wav"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                if ".tmp." not in name:
+                    entries.append((stat.st_mtime, stat.st_size, name))
+                elif now - stat.st_mtime > self.stale_temp_seconds:
+                    self.discard(os.path.join(self.cache_dir, name))
+                    logger.info(f"Removed stale temp file {name}")
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self.discard(os.path.join(self.cache_dir, name))
+                total -= size
+                logger.info(f"Evicted cached song {name}")
+
+def model_version(checkpoint_path):
+    """
+    Identifies the generator checkpoint by mtime and size, without loading it.
+    """
+    version = os.getenv("MODEL_VERSION")
+    if version:
+        return version
+    try:
+        stat = os.stat(checkpoint_path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except FileNotFoundError:
+        return "missing"
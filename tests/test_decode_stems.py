@@ -0,0 +1,46 @@
+import os
+import tempfile
+import pytest
+
+torch = pytest.importorskip("torch")
+for name in ("LOG_DIR", "MODEL_DIR", "OUTPUT_DIR"):
+    os.environ.setdefault(name, tempfile.gettempdir())
+import generate
+
+class FakeEncodec:
+    """
+    Stands in for EnCodec's decode: batch entries are independent, axis 1
+    (codebooks) is summed, and every latent frame becomes hop samples.
+    """
+    hop = 4
+
+    def decode(self, codes):
+        mixed = torch.tanh(codes).sum(dim=1)
+        return mixed.sum(dim=-2).repeat_interleave(self.hop, dim=-1)[:, None]
+
+@pytest.fixture
+def encodec(monkeypatch):
+    model = FakeEncodec()
+    monkeypatch.setattr(generate, "get_encodec_model", lambda: model)
+    return model
+
+def single_stem_decode(model, encodec_output, track, encodec_dim):
+    # The pre-batching per-stem call: (1, T, dim) -> (1, 1, dim, T)
+    latents = encodec_output[:, :, track * encodec_dim:(track + 1) * encodec_dim].permute(0, 2, 1).unsqueeze(0)
+    return model.decode(latents).reshape(-1)
+
+@pytest.mark.parametrize("batch", [1, 3])
+def test_batched_decode_matches_single_stem_decodes(encodec, batch):
+    num_tracks, encodec_dim, n_frames = 4, 6, 20
+    encodec_output = torch.randn(batch, n_frames, num_tracks * encodec_dim)
+    stems = generate.decode_stem_batch(encodec_output, num_tracks, encodec_dim)
+    assert stems.shape == (batch, num_tracks, n_frames * encodec.hop)
+    for b in range(batch):
+        for track in range(num_tracks):
+            expected = single_stem_decode(encodec, encodec_output[b:b + 1], track, encodec_dim)
+            torch.testing.assert_close(stems[b, track], expected)
+
+def test_decode_stems_is_first_batch_entry(encodec):
+    encodec_output = torch.randn(1, 12, 4 * 6)
+    torch.testing.assert_close(generate.decode_stems(encodec_output, 4, 6),
+                               generate.decode_stem_batch(encodec_output, 4, 6)[0])
@@ -0,0 +1,14 @@
+from jobs import JobQueue
+from result_cache import ResultCache
+
+def test_cache_hits_are_pruned(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = "a" * 32
+    open(cache.path(key), "wb").close()
+    queue = JobQueue(max_finished=5, cache=cache)
+
+    job_ids = [queue.submit(f"user{i}", {"prompt": "song"}, key=key) for i in range(200)]
+
+    assert len(queue._jobs) <= 5
+    # The newest hits are the ones kept
+    assert all(queue.get(job_id)["result"] == cache.path(key) for job_id in job_ids[-5:])
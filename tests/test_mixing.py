@@ -0,0 +1,60 @@
+import math
+import numpy as np
+import pytest
+from audio.mixing import StreamingMixer, limit, mix, resample, resample_filter
+
+def zero_stuffed_resample(audio, orig_sr, target_sr):
+    # Direct form of the same filter: upsample by zero stuffing, filter, keep every down-th sample
+    g = math.gcd(orig_sr, target_sr)
+    up, down = target_sr // g, orig_sr // g
+    h = resample_filter(up, down)
+    out_len = -(-audio.shape[-1] * up // down)
+    out = []
+    for channel in audio:
+        upsampled = np.zeros(len(channel) * up, dtype=np.float32)
+        upsampled[::up] = channel
+        out.append(np.convolve(upsampled, h)[len(h) // 2::down][:out_len])
+    return np.array(out)
+
+@pytest.mark.parametrize("orig_sr, target_sr", [(24000, 16000), (44100, 16000), (44100, 48000), (16000, 24000),
+                                                (48000, 44100)])
+def test_resample_matches_zero_stuffed_filter(orig_sr, target_sr):
+    audio = np.random.default_rng(0).standard_normal((2, 600)).astype(np.float32)
+    expected = zero_stuffed_resample(audio, orig_sr, target_sr)
+    np.testing.assert_allclose(resample(audio, orig_sr, target_sr, block=97), expected, atol=1e-5)
+
+def test_resample_keeps_a_tone():
+    t = np.arange(24000) / 24000
+    tone = np.sin(2 * np.pi * 440 * t).astype(np.float32)[None]
+    out = resample(tone, 24000, 16000)[0]
+    expected = np.sin(2 * np.pi * 440 * np.arange(16000) / 16000)
+    # Away from the edges the tone passes through unchanged
+    np.testing.assert_allclose(out[500:-500], expected[500:-500], atol=1e-3)
+
+def test_limit_stays_under_threshold():
+    audio = np.random.default_rng(1).standard_normal((2, 5000)).astype(np.float32) * 3
+    audio[:, 0] = 5  # A peak on the very first sample needs the ramp from before the start
+    assert np.abs(limit(audio, threshold=0.98, lookahead=64)).max() <= 0.98 + 1e-6
+
+@pytest.mark.parametrize("target_sr", [None, 16000, 44100])
+@pytest.mark.parametrize("pans", [None, [-0.5, 0.5, 0.0, 1.0]])
+@pytest.mark.parametrize("chunk", [1, 257, 4800])
+def test_streaming_mixer_matches_mix(target_sr, pans, chunk):
+    stems = np.random.default_rng(2).standard_normal((4, 9600)).astype(np.float32)
+    expected = mix(stems, pans=pans, orig_sr=24000, target_sr=target_sr)
+    mixer = StreamingMixer(pans=pans, orig_sr=24000, target_sr=target_sr)
+    # Uneven chunks, as decoded segments arrive
+    sizes = [chunk, 3 * chunk + 1, chunk // 2 + 1]
+    parts, start, i = [], 0, 0
+    while start < stems.shape[1]:
+        size = sizes[i % len(sizes)]
+        parts.append(mixer.push(stems[:, start:start + size]))
+        start, i = start + size, i + 1
+    parts.append(mixer.flush())
+    streamed = np.concatenate(parts, axis=-1)
+    assert streamed.shape == expected.shape
+    np.testing.assert_allclose(streamed, expected, atol=1e-5)
+
+def test_streaming_mixer_flush_without_input():
+    assert StreamingMixer().flush().shape == (0,)
+    assert StreamingMixer(pans=[0, 0, 0, 0]).flush().shape == (2, 0)
@@ -0,0 +1,16 @@
+import os
+from model_registry import ModelRegistry
+
+def test_missing_checkpoint_keeps_loaded_model(tmp_path):
+    checkpoint = tmp_path / "model.pt"
+    checkpoint.write_bytes(b"weights")
+    registry = ModelRegistry(check_interval=0)
+    registry.register("model", factory=None, checkpoint_path=str(checkpoint))
+    entry = registry._entries["model"]
+    loaded = object()
+    entry["model"], entry["stamp"] = loaded, registry._stamp(str(checkpoint))
+
+    # Between unlinking the old checkpoint and renaming the new one into place
+    os.remove(checkpoint)
+
+    assert registry.get("model") is loaded
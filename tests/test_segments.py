@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+from tensorflow.keras import layers, models
+from audio.segments import SegmentCausalConv1D, segment_recurrent
+
+def build_pair():
+    # Packed conv -> LSTM -> SimpleRNN stack and the plain layers it stands in for
+    x = layers.Input((None, 5))
+    resets = layers.Input((None, 1))
+    y = SegmentCausalConv1D(7, 3, activation="relu")([x, resets])
+    y = segment_recurrent(layers.LSTMCell(6), y, resets)
+    y = segment_recurrent(layers.SimpleRNNCell(4), y, resets)
+    packed = models.Model([x, resets], y)
+
+    x = layers.Input((None, 5))
+    y = layers.Conv1D(7, 3, padding="causal", activation="relu")(x)
+    y = layers.LSTM(6, return_sequences=True)(y)
+    y = layers.SimpleRNN(4, return_sequences=True)(y)
+    plain = models.Model(x, y)
+    return packed, plain
+
+def test_weights_match_plain_layers():
+    packed, plain = build_pair()
+    assert [w.shape for w in packed.trainable_weights] == [w.shape for w in plain.trainable_weights]
+
+def test_packed_segments_match_separate_sequences():
+    packed, plain = build_pair()
+    plain.set_weights(packed.get_weights())
+    rng = np.random.default_rng(0)
+    songs = [rng.standard_normal((1, n, 5)).astype(np.float32) for n in (10, 2, 14)]
+    resets = np.zeros((1, 26, 1), dtype=np.float32)
+    resets[0, [0, 10, 12]] = 1
+
+    out = packed.predict([np.concatenate(songs, axis=1), resets], verbose=0)
+    start = 0
+    for song in songs:
+        length = song.shape[1]
+        np.testing.assert_allclose(out[:, start:start + length], plain.predict(song, verbose=0), atol=1e-5)
+        start += length
+
+def test_unpacked_sequence_matches_plain():
+    packed, plain = build_pair()
+    plain.set_weights(packed.get_weights())
+    x = np.random.default_rng(1).standard_normal((2, 9, 5)).astype(np.float32)
+    resets = np.zeros((2, 9, 1), dtype=np.float32)
+    resets[:, 0] = 1
+    np.testing.assert_allclose(packed.predict([x, resets], verbose=0), plain.predict(x, verbose=0), atol=1e-5)